@@ -11,8 +11,17 @@
 import gym
 import torch as t
 import numpy as np
-import matplotlib.pyplot as plt
+from functools import partial
 import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from common.checkpoint import Checkpointer
+from common.dataset import RecordingEnv
+from common.evaluator import AsyncEvaluator,sample_action
+from common.metrics import MetricsWriter
+from common.profiler import Profiler
+from common.returns import discounted_returns
+from common.vec_env import CartPoleVecEnv
 
 GAMMA = 0.99 # discount factor
 lr_mu        = 0.0005
@@ -42,7 +51,7 @@ class Policy_net(t.nn.Module):
         x = self.input_hidden(x)
         x = t.relu(x)
         preference=self.hidden_preference(x)
-        m=t.nn.Softmax()
+        m=t.nn.Softmax(dim=-1)  #对最后一维（动作）归一化，单个状态和一批状态都对
         action_probabilities=m(preference)
         return action_probabilities
 
@@ -58,64 +67,143 @@ class Actor_critic():
 
     self.critic_net=Q_net(self.state_dim,20,1)
     self.critic_optim=t.optim.SGD(params=self.critic_net.parameters(), lr=0.1)
+    self.profiler=Profiler(PROFILE,trace_updates=TRACE_UPDATES,trace_path=os.path.join(os.path.dirname(os.path.realpath(__file__)),'trace.json'))
 
   def learn(self,state,action,reward,next_state):
       td_error=self.train_critic(state,reward,next_state) 
       self.train_actor(state,action,td_error)
 
   def train_actor(self,state,action,td_error):
-    one_hot_action = t.zeros(self.action_dim)
-    one_hot_action[action] = 1
-    action_probabilities=self.actor_net(t.tensor(state))
-    neg_log_prob=t.sum(-t.log(action_probabilities)*one_hot_action)
-    neg_expect=-neg_log_prob.view(1)*td_error.item()
-
-    self.actor_optim.zero_grad()
-    neg_expect.backward()
+    with self.profiler.timer('forward'):
+      one_hot_action = t.zeros(self.action_dim)
+      one_hot_action[action] = 1
+      action_probabilities=self.actor_net(t.tensor(state))
+      neg_log_prob=t.sum(-t.log(action_probabilities)*one_hot_action)
+      neg_expect=-neg_log_prob.view(1)*td_error.item()
+
+    with self.profiler.timer('backward'):
+      self.actor_optim.zero_grad()
+      neg_expect.backward()
     #查看step前后 参数的data和grad
     #print(self.actor_net.hidden_preference.weight.data,self.actor_net.hidden_preference.weight.grad)
-    self.actor_optim.step()
+    with self.profiler.timer('optimizer'):
+      self.actor_optim.step()
     #print(self.actor_net.hidden_preference.weight.data)
 
     return neg_expect
   
   def train_critic(self,state,reward,next_state):
-      current_value = self.critic_net(t.tensor(state))
-      target_value = reward + GAMMA * self.critic_net(t.tensor(next_state))
-      td_error=target_value-current_value
+      with self.profiler.timer('forward'):
+        current_value = self.critic_net(t.tensor(state))
+        target_value = reward + GAMMA * self.critic_net(t.tensor(next_state))
+        td_error=target_value-current_value
 
-      loss=td_error**2
-      self.critic_optim.zero_grad()
-      loss.backward()
+        loss=td_error**2
+      with self.profiler.timer('backward'):
+        self.critic_optim.zero_grad()
+        loss.backward()
       #查看step前后 参数的data和grad
       #print(self.critic_net.layer2.weight.data,self.critic_net.layer2.weight.grad)
-      self.critic_optim.step()
+      with self.profiler.timer('optimizer'):
+        self.critic_optim.step()
       #print(self.critic_net.layer2.weight.data)
       return td_error
 
+  def learn_rollout(self,states,actions,rewards,next_states,dones,truncated):
+    '''
+    A2C update on a k-step rollout of N envs, every argument is [k,N,...] as collected step by step.
+    next_states are the real next observations (infos['final_obs']), dones cut the return,
+    truncated episodes bootstrap from the value of their last observation.
+    '''
+    k,n=rewards.shape
+    with self.profiler.timer('forward'):
+      states=t.tensor(states).view(k*n,-1)
+      next_states=t.tensor(next_states).view(k*n,-1)
+      values=self.critic_net(t.cat([states,next_states])).view(2,k,n)  #状态和下一状态拼在一起只过一次critic
+      current_values=values[0]
+      next_values=values[1].detach().numpy()
+
+      rewards=rewards+GAMMA*next_values*truncated  #超时截断的episode在截断处用V(s')补上
+      targets=discounted_returns(rewards.T,GAMMA,dones.T,next_values[-1]).T
+      td_errors=t.tensor(targets)-current_values
+
+      critic_loss=t.mean(td_errors**2)
+    with self.profiler.timer('backward'):
+      self.critic_optim.zero_grad()
+      critic_loss.backward()
+    with self.profiler.timer('optimizer'):
+      self.critic_optim.step()
+
+    with self.profiler.timer('forward'):
+      action_probabilities=self.actor_net(states)
+      log_prob=t.log(action_probabilities.gather(1,t.tensor(actions).view(-1,1))).view(-1)
+      neg_expect=-t.mean(log_prob*td_errors.detach().view(-1))
+    with self.profiler.timer('backward'):
+      self.actor_optim.zero_grad()
+      neg_expect.backward()
+    with self.profiler.timer('optimizer'):
+      self.actor_optim.step()
+    return critic_loss.item()
+
   def choose_action(self,state):
-    action_probabilities=self.actor_net(t.tensor(state))
+    batch=np.ndim(state)==2 #向量化环境传入[N,state_dim]的一批状态
+    with t.no_grad():
+      action_probabilities=self.actor_net(t.tensor(state).view(-1,self.state_dim))
     action=t.distributions.Categorical(action_probabilities).sample()
+    if batch:
+      return action.numpy()
     return action.item()
 
+  def state_dict(self):
+    #网络和优化器的状态，足够从中断处原样继续训练
+    return {'actor_net':self.actor_net.state_dict(),
+            'actor_optim':self.actor_optim.state_dict(),
+            'critic_net':self.critic_net.state_dict(),
+            'critic_optim':self.critic_optim.state_dict()}
+
+  def load_state_dict(self,state):
+    self.actor_net.load_state_dict(state['actor_net'])
+    self.actor_optim.load_state_dict(state['actor_optim'])
+    self.critic_net.load_state_dict(state['critic_net'])
+    self.critic_optim.load_state_dict(state['critic_optim'])
+
 # ---------------------------------------------------------
 # Hyper Parameters
 ENV_NAME = 'CartPole-v0'
 EPISODE =2000 # Episode limitation
 #STEP = 300 # Step limitation in an episode 300步没啥用，坚持到了200步done为true自然就结束episode了
 TEST = 10 # The number of experiment test every 100 episode
+NUM_ENVS = 1 # >1 trains A2C on that many CartPole copies stepped together
+ROLLOUT_STEPS = 5 # k steps of every env per A2C update
+CHECKPOINT_INTERVAL = 100 # episodes between resumable checkpoints, 0 turns them off
+RECORD_DIR = None # directory to record every env transition into as an offline dataset (tools/train_offline.py)
+PROFILE = False # print env steps/s, updates/s and per-phase time shares every 10 s
+TRACE_UPDATES = None # (first, n): torch.profiler chrome trace of n updates, written next to the script
 
-def main():
-  # initialize OpenAI Gym env and dqn agent
-  env = gym.make(ENV_NAME)  #生成环境
-  agent = Actor_critic(env)
+def make_env():
+  if NUM_ENVS>1:
+    return CartPoleVecEnv(NUM_ENVS)
+  return gym.make(ENV_NAME)  #生成环境
+
+def log_evaluations(metrics,results):
+  for test_episode,ave_reward in results:
+    print ('episode: ',test_episode,'Evaluation Average Reward:',ave_reward)
+    metrics.log('eval',episode=test_episode,reward=float(ave_reward))
 
-  steps_per=[]
+def train(env,agent,metrics):
   count=0
   test_num=0
   is_converge=False
+  evaluator=AsyncEvaluator(partial(gym.make,ENV_NAME),agent.actor_net,sample_action,episodes=TEST)
   
-  for episode in range(EPISODE):
+  checkpointer=Checkpointer(os.path.join(os.path.dirname(os.path.realpath(__file__)),'checkpoints'),CHECKPOINT_INTERVAL)
+  start_episode=0
+  checkpoint=checkpointer.load()
+  if checkpoint is not None:  #从上次保存的checkpoint接着训练
+    agent.load_state_dict(checkpoint['agent'])
+    start_episode,count,test_num,is_converge=checkpoint['train']
+  metrics.log_start(start_episode)
+  for episode in range(start_episode,EPISODE):
     if test_num>10:
       break
     
@@ -123,9 +211,14 @@ def main():
     steps=0
     while not is_converge:
         env.render()    # 刷新环境
-        action = agent.choose_action(state) # e-greedy action for train
-        next_state,reward,done,_ = env.step(action)
-        agent.learn(state,action,reward,next_state)
+        with agent.profiler.timer('act'):
+          action = agent.choose_action(state) # e-greedy action for train
+        with agent.profiler.timer('env_step'):
+          next_state,reward,done,_ = env.step(action)
+          agent.profiler.count('env_step')
+        with agent.profiler.update():
+          agent.learn(state,action,reward,next_state)
+        agent.profiler.maybe_report()
         
         '''x, x_dot, theta, theta_dot = next_state
         r1 = (env.x_threshold - abs(x))/env.x_threshold - 0.8
@@ -144,40 +237,85 @@ def main():
                 is_converge=True
         else:
             count=0
-        steps_per.append(steps)
+        metrics.log('episode',episode=episode,steps=int(steps))
         print('episode:',episode,'  steps ：',steps)
     # Test every 100 episodes
     if (episode+1) % 30 == 0:  #测试10次的平均reward，采用target policy
       if is_converge:
         test_num=test_num+1
 
-      total_reward = 0
-      for i in range(TEST):
-        state = env.reset()
-        while True:
-          env.render()
-          action = agent.choose_action(state) # direct action for test
-          state,reward,done,_ = env.step(action)
-          total_reward += reward
-          if done:
-            break
-      ave_reward = total_reward/TEST
-      print ('episode: ',episode,'Evaluation Average Reward:',ave_reward)
+      evaluator.submit(episode,agent.actor_net)  #把当前参数交给后台进程测试，不阻塞训练
+    log_evaluations(metrics,evaluator.poll())
+    checkpointer.maybe_save(episode+1,lambda:{'agent':agent.state_dict(),
+                                              'train':[episode+1,count,test_num,is_converge]})
   
-  fig=plt.figure()
-  ax1=fig.add_subplot(111)
-  ax1.plot(steps_per,'b')
-  ax1.set_ylabel('steps in each episode')
-  ax1.set_title("leaning curves")
+  log_evaluations(metrics,evaluator.close())
+  checkpointer.close()
 
-  #plt.show()
+def train_vec(env,agent,metrics):
+  # A2C：所有环境同步走ROLLOUT_STEPS步，整段rollout做一次批量更新
+  count=0
+  episode=0
+  evaluator=AsyncEvaluator(partial(gym.make,ENV_NAME),agent.actor_net,sample_action,episodes=TEST)
+  checkpointer=Checkpointer(os.path.join(os.path.dirname(os.path.realpath(__file__)),'checkpoints'),CHECKPOINT_INTERVAL)
+  checkpoint=checkpointer.load()
+  if checkpoint is not None:  #从上次保存的checkpoint接着训练，进行到一半的episode重新开始
+    agent.load_state_dict(checkpoint['agent'])
+    episode,count=checkpoint['train'][:2]
+  metrics.log_start(episode)
+  state = env.reset()
+  while episode<EPISODE and count<=25:
+    rollout=[]
+    for step in range(ROLLOUT_STEPS):
+      with agent.profiler.timer('act'):
+        action = agent.choose_action(state) # one sampled action per env
+      with agent.profiler.timer('env_step'):
+        next_state,reward,done,infos = env.step(action)
+        agent.profiler.count('env_step',env.num_envs)
+      rollout.append((state,action,reward,infos['final_obs'],done,infos['truncated']))
+      state = next_state
 
+      for steps in infos['episode_lengths'][done]:  #本次step中结束的episode
+        if steps==200:
+          count=count+1
+        else:
+          count=0
+        metrics.log('episode',episode=episode,steps=int(steps))
+        print('episode:',episode,'  steps ：',steps)
+        episode=episode+1
+        if episode % 30 == 0:
+          evaluator.submit(episode-1,agent.actor_net)  #把当前参数交给后台进程测试，不阻塞训练
+        checkpointer.maybe_save(episode,lambda:{'agent':agent.state_dict(),'train':[episode,count,0,False]})  #和train的格式一样
+    states,actions,rewards,next_states,dones,truncated=[np.array(x) for x in zip(*rollout)]
+    with agent.profiler.update():
+      agent.learn_rollout(states,actions,rewards,next_states,dones.astype(np.float64),truncated.astype(np.float64))
+    agent.profiler.maybe_report()
+    log_evaluations(metrics,evaluator.poll())
+
+  log_evaluations(metrics,evaluator.close())
+  checkpointer.close()
+
+def main(env=None):
+  # initialize OpenAI Gym env and actor critic agent
+  # env can also be a vector env (CartPoleVecEnv, SubprocVecEnv) in place of gym.make(ENV_NAME)
+  if env is None:
+    env = make_env()
+  if RECORD_DIR:  #所有经过环境的transition都存成离线数据集，reward不做处理
+    env = RecordingEnv(env,RECORD_DIR)
+  agent = Actor_critic(env)
   script_path = os.path.realpath(__file__)
   script_dir = os.path.dirname(script_path)
-  path=script_dir+'\\learning_curve.png'
-  plt.savefig(path,dpi=1200)
-  t.save(agent.actor_net,script_dir+'\\actor_net_model.pkl')
-  t.save(agent.critic_net,script_dir+'\\critic_net_model.pkl')
+  metrics = MetricsWriter(os.path.join(script_dir,'metrics.jsonl'))  #训练过程边跑边写文件，画图交给tools/plot_metrics.py
+  if hasattr(env,'num_envs'):
+    train_vec(env,agent,metrics)
+  else:
+    train(env,agent,metrics)
+  metrics.close()
+  env.close()
+
+  t.save(agent.actor_net,os.path.join(script_dir,'actor_net_model.pkl'))
+  t.save(agent.critic_net,os.path.join(script_dir,'critic_net_model.pkl'))
+  print('learning curves: python tools/plot_metrics.py',metrics.path)
 
 if __name__ == '__main__':
   main()
\ No newline at end of file
@@ -2,10 +2,18 @@ import gym
 import torch as t
 import torch.nn.functional as F
 import numpy as np
-import matplotlib.pyplot as plt
-from collections import deque
-import random
 import time
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from common.checkpoint import Checkpointer
+from common.dataset import RecordingEnv
+from common.metrics import MetricsWriter
+from common.numpy_policy import NumpyMLP
+from common.prefetch import PrefetchSampler
+from common.profiler import Profiler
+from common.replay_buffer import ReplayBuffer
+from common.target_sync import TargetSync
 t.set_default_tensor_type(t.DoubleTensor)
 from torch.nn import init
 #define the initial function to init the layer's parameters for the network
@@ -19,7 +27,14 @@ def param_init(net):
 GAMMA = 0.99 # discount factor for target Q
 REPLAY_SIZE = 50000 # experience replay buffer size
 BATCH_SIZE = 32 # size of minibatch
+PROFILE = False # print env steps/s, updates/s and per-phase time shares every 10 s
+TRACE_UPDATES = None # (first, n): torch.profiler chrome trace of n updates, written next to the script
 TAU=0.005
+LEARN_START = 2000 # transitions in the buffer before learning starts
+
+def collate_batch(batch):
+    state_batch,action_batch,reward_batch,next_state_batch,done_batch = batch
+    return state_batch,action_batch,reward_batch.view(-1,1),next_state_batch,done_batch
 
 class Q_net(t.nn.Module):
     def __init__(self):
@@ -36,6 +51,10 @@ class Q_net(t.nn.Module):
         q=self.hidden2_output(q)
         return q
 
+def scaled_tanh(x):    # output of Policy_net, in place for NumpyMLP
+    np.tanh(x,out=x)
+    x*=2
+
 class Policy_net(t.nn.Module):
     def __init__(self):
         t.nn.Module.__init__(self)
@@ -51,7 +70,9 @@ class Policy_net(t.nn.Module):
 class DDPG():
   # DQN Agent
     def __init__(self):
-        self.replay_buffer = deque()
+        self.replay_buffer = ReplayBuffer(REPLAY_SIZE,3,action_shape=(1,),action_dtype=np.float64,dtype=np.float64)
+        #后台线程提前采样并整理好minibatch，learn()直接取用
+        self.sampler = PrefetchSampler(self.replay_buffer,BATCH_SIZE,collate=collate_batch,min_size=LEARN_START)
         self.current_actor=Policy_net()
         #param_init(self.current_actor)
         self.target_actor=Policy_net()
@@ -64,52 +85,88 @@ class DDPG():
         self.target_critic.load_state_dict(self.current_critic.state_dict())
         self.critic_optim=t.optim.Adam(params=self.current_critic.parameters(), lr=0.001)
 
+        #current和target的参数各放进一块连续内存，软更新只需一次原地lerp
+        self.actor_sync=TargetSync(self.current_actor,self.target_actor)
+        self.critic_sync=TargetSync(self.current_critic,self.target_critic)
+        #选动作用的numpy副本，target同步时刷新
+        self.fast_actor=NumpyMLP([self.current_actor.state_hidden1,self.current_actor.hidden1_hidden2,
+                                  self.current_actor.hidden2_output],output_fn=scaled_tanh)
+        self.profiler=Profiler(PROFILE,trace_updates=TRACE_UPDATES,trace_path=os.path.join(os.path.dirname(os.path.realpath(__file__)),'trace.json'))
+
     def store_transition(self,state,action,reward,next_state,done):
-        self.replay_buffer.append((state,action,reward,next_state,done))#将S A R S A存入经验池
-        if len(self.replay_buffer) > REPLAY_SIZE: #超过经验池的容量则开始舍弃最老的
-            self.replay_buffer.popleft()
+        with self.profiler.timer('store'):
+            if np.ndim(reward)>0: #向量化环境一次传入一批transition
+                self.replay_buffer.store_batch(state,action,reward,next_state,done)
+            else:
+                self.replay_buffer.store(state,action,reward,next_state,done)#将S A R S A存入经验池，满了自动覆盖最老的
+            self.sampler.stored()  #够LEARN_START后唤醒采样线程
+
+    def choose_action(self,state):
+        #state可以是单个状态，也可以是向量化环境的[N,3]一批状态，一次前向算出全部动作
+        return self.fast_actor(state).copy()
 
     def learn(self):
-        minibatch = random.sample(self.replay_buffer,BATCH_SIZE)  #采样
-        '''minibatch = self.replay_buffer[-1]
-        state_batch = t.tensor(minibatch[0]).view(1,-1)
-        action_batch = t.tensor(minibatch[1]).view(1,-1)
-        reward_batch = t.tensor(minibatch[2]).view(1,-1)
-        next_state_batch = t.tensor(minibatch[3]).view(1,-1)'''
-        state_batch = t.tensor([data[0] for data in minibatch])
-        action_batch = t.tensor([data[1] for data in minibatch]).view(BATCH_SIZE,-1)
-        reward_batch = t.tensor([data[2] for data in minibatch]).view(BATCH_SIZE,-1)
-        next_state_batch = t.tensor([data[3] for data in minibatch])
+        with self.profiler.timer('sample'):
+            state_batch,action_batch,reward_batch,next_state_batch,done_batch = self.sampler.sample(BATCH_SIZE)  #采样
         
-        next_action_batch=self.target_actor(next_state_batch)
-        current_values = self.current_critic(state_batch,action_batch)
-        target_values = reward_batch + GAMMA * self.target_critic(next_state_batch,next_action_batch)
-        #td_errors=target_values.detach()-current_values
-        critic_loss=F.smooth_l1_loss(target_values.detach(),current_values)
+        with self.profiler.timer('forward'):
+            next_action_batch=self.target_actor(next_state_batch)
+            current_values = self.current_critic(state_batch,action_batch)
+            target_values = reward_batch + GAMMA * self.target_critic(next_state_batch,next_action_batch)
+            #td_errors=target_values.detach()-current_values
+            critic_loss=F.smooth_l1_loss(target_values.detach(),current_values)
         #critic_loss=t.sum(td_errors**2)
-        self.critic_optim.zero_grad()
-        critic_loss.backward()
+        with self.profiler.timer('backward'):
+            self.critic_optim.zero_grad()
+            critic_loss.backward()
         #print(self.current_critic.hidden2_output.weight.data,self.current_critic.hidden2_output.weight.grad)
-        self.critic_optim.step()
+        with self.profiler.timer('optimizer'):
+            self.critic_optim.step()
         #print(self.current_critic.hidden2_output.weight.data)  
 
-        actions=self.current_actor(state_batch)
-        current_values = self.current_critic(state_batch,actions)
-        actor_loss=-t.mean(current_values)
-        self.current_actor.zero_grad()
-        actor_loss.backward()
+        with self.profiler.timer('forward'):
+            actions=self.current_actor(state_batch)
+            current_values = self.current_critic(state_batch,actions)
+            actor_loss=-t.mean(current_values)
+        with self.profiler.timer('backward'):
+            self.current_actor.zero_grad()
+            actor_loss.backward()
         #print(self.current_actor.hidden2_output.weight.data,self.current_actor.hidden2_output.weight.grad)
-        self.actor_optim.step()
+        with self.profiler.timer('optimizer'):
+            self.actor_optim.step()
         #print(self.current_actor.hidden2_output.weight.data)
+        return critic_loss.item()
 
             
     
+    def close(self):
+        self.sampler.close()
+
     def update_target_net(self):
-        for target_param,current_param in zip(self.target_critic.parameters(),self.current_critic.parameters()):
-            target_param.data.copy_(TAU*current_param.data+(1-TAU)*target_param.data)
-        
-        for target_param,current_param in zip(self.target_actor.parameters(),self.current_actor.parameters()):
-            target_param.data.copy_(TAU*current_param.data+(1-TAU)*target_param.data)
+        with self.profiler.timer('target_sync'):
+            self.critic_sync.soft_update(TAU)
+            self.actor_sync.soft_update(TAU)
+            self.fast_actor.refresh()
+
+    def state_dict(self):
+        #网络、优化器和经验池，足够从中断处原样继续训练
+        return {'current_actor':self.current_actor.state_dict(),
+                'target_actor':self.target_actor.state_dict(),
+                'actor_optim':self.actor_optim.state_dict(),
+                'current_critic':self.current_critic.state_dict(),
+                'target_critic':self.target_critic.state_dict(),
+                'critic_optim':self.critic_optim.state_dict(),
+                'replay_buffer':self.replay_buffer.state_dict()}
+
+    def load_state_dict(self,state):
+        self.current_actor.load_state_dict(state['current_actor'])
+        self.fast_actor.refresh()
+        self.target_actor.load_state_dict(state['target_actor'])
+        self.actor_optim.load_state_dict(state['actor_optim'])
+        self.current_critic.load_state_dict(state['current_critic'])
+        self.target_critic.load_state_dict(state['target_critic'])
+        self.critic_optim.load_state_dict(state['critic_optim'])
+        self.replay_buffer.load_state_dict(state['replay_buffer'])
 
 
 class OrnsteinUhlenbeckNoise:
@@ -128,44 +185,70 @@ class OrnsteinUhlenbeckNoise:
 # Hyper Parameters
 EPISODE =5000 # Episode limitation
 TEST = 10 # The number of experiment test every 100 episode
+CHECKPOINT_INTERVAL = 100 # episodes between resumable checkpoints, 0 turns them off
+RECORD_DIR = None # directory to record every env transition into as an offline dataset (tools/train_offline.py)
 
 def main():
   # initialize OpenAI Gym env and dqn agent
     ENV_NAME = 'Pendulum-v0'
     env = gym.make(ENV_NAME)
+    if RECORD_DIR:  #所有经过环境的transition都存成离线数据集，reward不做处理
+        env = RecordingEnv(env,RECORD_DIR)
     #env.seed(0)
     agent = DDPG()
 
     ou_noise = OrnsteinUhlenbeckNoise(mu=np.zeros(1))
     rewards=0
-    for episode in range(EPISODE):
+    script_dir = os.path.dirname(os.path.realpath(__file__))
+    metrics = MetricsWriter(os.path.join(script_dir,'metrics.jsonl'))  #训练过程边跑边写文件，画图交给tools/plot_metrics.py
+    checkpointer=Checkpointer(os.path.join(os.path.dirname(os.path.realpath(__file__)),'checkpoints'),CHECKPOINT_INTERVAL)
+    start_episode=0
+    checkpoint=checkpointer.load()
+    if checkpoint is not None:  #从上次保存的checkpoint接着训练
+        agent.load_state_dict(checkpoint['agent'])
+        start_episode,rewards,ou_noise.x_prev=checkpoint['train']
+        ou_noise.x_prev=np.array(ou_noise.x_prev)
+    metrics.log_start(start_episode)
+    for episode in range(start_episode,EPISODE):
         '''if test_num>10:
             break'''
         #start=time.time()
         state = env.reset() # initialize task
+        episode_reward=0
         for step in range(300):
             if episode % 20==0 and episode!=0:
                 env.render()
-            action = agent.current_actor(t.from_numpy(state))
+            with agent.profiler.timer('act'):
+                action = agent.choose_action(state)
             action=action.item()+ou_noise()[0]
             #action=action.item()
-            next_state,reward,done,_ = env.step([action])
+            with agent.profiler.timer('env_step'):
+                next_state,reward,done,_ = env.step([action])
+                agent.profiler.count('env_step')
             
             agent.store_transition(state,action,reward/100,next_state,done)
+            agent.profiler.maybe_report()
             
             state = next_state
             rewards=rewards+reward 
+            episode_reward=episode_reward+reward
             if done:
                 break
         
-        if len(agent.replay_buffer) > 2000:
+        loss=None
+        if len(agent.replay_buffer) > LEARN_START:
+            loss=0
             for i in range(10):
-                agent.learn()
+                with agent.profiler.update():
+                    loss=loss+agent.learn()/10
                 agent.update_target_net()
+        metrics.log('episode',episode=episode,steps=step+1,reward=float(episode_reward),loss=loss)
 
         if episode%20==0:
             print('episode:',episode,' rewards:',rewards/20)
             rewards=0
+        checkpointer.maybe_save(episode+1,lambda:{'agent':agent.state_dict(),
+                                                  'train':[episode+1,rewards,ou_noise.x_prev]})
         #end=time.time()
         #a=(end-start)*1000
         #print(a)
@@ -189,20 +272,12 @@ def main():
             ave_reward = total_reward/TEST
             print ('episode: ',episode,'Evaluation Average Reward:',ave_reward)
         
-    fig=plt.figure()
-    ax1=fig.add_subplot(111)
-    #ax1.plot(steps_per,'b')
-    ax1.set_ylabel('steps in each episode')
-    ax1.set_title("leaning curves")
-
-    #plt.show()
-
-    script_path = os.path.realpath(__file__)
-    script_dir = os.path.dirname(script_path)
-    path=script_dir+'\\learning_curve.png'
-    plt.savefig(path,dpi=1200)
-    #t.save(agent.actor_net,script_dir+'\\actor_net_model.pkl')
-    #t.save(agent.critic_net,script_dir+'\\critic_net_model.pkl')'''
+    #t.save(agent.actor_net,os.path.join(script_dir,'actor_net_model.pkl'))
+    #t.save(agent.critic_net,os.path.join(script_dir,'critic_net_model.pkl'))'''
+    checkpointer.close()
+    metrics.close()
+    agent.close()
+    env.close()  #录制数据集时写出最后一个shard
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
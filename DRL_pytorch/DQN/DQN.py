@@ -14,14 +14,37 @@ from torch import nn
 from torch import  optim
 import numpy as np
 import random
-from collections import deque
-import matplotlib.pyplot as plt
+import threading
+from functools import partial
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from common.checkpoint import Checkpointer,latest_checkpoint
+from common.compact_replay import CompactReplayBuffer
+from common.dataset import RecordingEnv
+from common.ensemble import EnsembleMLP,EnsembleReplayBuffer,EnsembleSGD
+from common.evaluator import AsyncEvaluator,greedy_action
+from common.learner_thread import LearnerThread
+from common.metrics import MetricsWriter
+from common.numpy_policy import NumpyMLP
+from common.prefetch import PrefetchSampler
+from common.profiler import Profiler
+from common.replay_buffer import MemmapReplayBuffer,ReplayBuffer
+from common.subproc_vec_env import SubprocVecEnv
+from common.td_target import max_q_target,q_selected
+from common.vec_env import CartPoleVecEnv
 
 # Hyper Parameters for DQN
 GAMMA = 0.9 # discount factor for target Q
 INITIAL_EPSILON = 0.5 # starting value of epsilon
 REPLAY_SIZE = 10000 # experience replay buffer size
+REPLAY_DIR = None # directory of a memory-mapped replay buffer, None keeps it in RAM
+COMPACT_REPLAY = False # True: observations stored once as float16, uint8 actions, bit-packed dones
 BATCH_SIZE = 32 # size of minibatch
+PROFILE = False # print env steps/s, updates/s and per-phase time shares every 10 s
+TRACE_UPDATES = None # (first, n): torch.profiler chrome trace of n updates, written next to the script
+LEARNER_THREAD = False # True: a background thread trains while the main thread steps the env
+REPLAY_RATIO = 1. # learner updates per env step with LEARNER_THREAD, None: as many as it can
 
 class Q_net(nn.Module):
     def __init__(self,in_features, hidden_features, out_features):
@@ -35,87 +58,181 @@ class Q_net(nn.Module):
 
 class DQN():
   # DQN Agent
-  def __init__(self, env):
-    # init experience replay
-    self.replay_buffer = deque()  #经验池
+  def __init__(self, env, resume=False):
     # init some parameters
     self.time_step = 0
     self.epsilon = INITIAL_EPSILON
     self.state_dim = env.observation_space.shape[0]
     self.action_dim = env.action_space.n
+    if COMPACT_REPLAY and REPLAY_DIR:  #压缩经验池只放在内存里，不能同时用memmap文件
+      raise ValueError('COMPACT_REPLAY keeps the replay in RAM, it cannot be combined with REPLAY_DIR')
+    if COMPACT_REPLAY:  #每个状态只存一份，s'从下一个槽位读出；向量化环境每个env一条独立的环
+      self.replay_buffer = CompactReplayBuffer(REPLAY_SIZE,self.state_dim,streams=getattr(env,'num_envs',1))
+    elif REPLAY_DIR:  #经验池放在磁盘上的memmap文件里，容量不受内存限制
+      #从checkpoint恢复时(resume)不截断已有文件：checkpoint只记录环形位置，数据要从这些文件里读回来；否则新建文件
+      self.replay_buffer = MemmapReplayBuffer(REPLAY_SIZE,self.state_dim,REPLAY_DIR,resume=resume)
+    else:
+      self.replay_buffer = ReplayBuffer(REPLAY_SIZE,self.state_dim)  # init experience replay 经验池
+    self.sampler = PrefetchSampler(self.replay_buffer,BATCH_SIZE,min_size=BATCH_SIZE+1)  #后台线程提前准备好minibatch
 
     self.q_net=Q_net(self.state_dim,15,self.action_dim)#定义网络及优化器和损失函数
     self.optimizer = optim.SGD(params=self.q_net.parameters(), lr=0.01)
     self.criterion = nn.MSELoss()
+    self.fast_q=NumpyMLP([self.q_net.layer1,self.q_net.layer2])  #选动作用的numpy副本，每次更新后刷新
+    self.profiler=Profiler(PROFILE,trace_updates=TRACE_UPDATES,trace_path=os.path.join(os.path.dirname(os.path.realpath(__file__)),'trace.json'))
+    self.net_lock=threading.Lock()  #学习时一直持有，同步目标网络、存checkpoint时也要拿，两个线程不会同时改网络
+    self.learner=None
 
   def perceive(self,state,action,reward,next_state,done):
     loss=0.0
-    one_hot_action = np.zeros(self.action_dim)  #将动作变为[0,1] [1,0]形式
-    one_hot_action[action] = 1
-    self.replay_buffer.append((state,one_hot_action,reward,next_state,done))#将S A R S A存入经验池
-    
-    if len(self.replay_buffer) > REPLAY_SIZE: #超过经验池的容量则开始舍弃最老的
-      self.replay_buffer.popleft()
+    with self.profiler.timer('store'):
+      if np.ndim(reward)>0: #向量化环境一次传入一批transition
+        self.replay_buffer.store_batch(state,action,reward,next_state,done)
+      else:
+        self.replay_buffer.store(state,action,reward,next_state,done)#将S A R S A存入经验池，满了自动覆盖最老的
+      self.sampler.stored()  #够min_size后唤醒采样线程
 
+    if LEARNER_THREAD:  #后台线程负责训练，这里只报告走了几步
+      if self.learner is None:
+        self.learner=LearnerThread(self.learn_step,lambda:len(self.replay_buffer) > BATCH_SIZE,REPLAY_RATIO)
+      self.learner.add_steps(np.size(reward))
+      return self.learner.loss
     if len(self.replay_buffer) > BATCH_SIZE:#经验池已有样本超过size就开始采样训练
-      loss=self.train_Q_network()
+      loss=self.learn_step()
 
     return loss
 
+  def learn_step(self):
+    with self.net_lock,self.profiler.update():
+      return self.train_Q_network()
+
   def train_Q_network(self):
     self.time_step += 1
     # Step 1: obtain random minibatch from replay memory
-    minibatch = random.sample(self.replay_buffer,BATCH_SIZE)  #采样
-    state_batch = t.from_numpy(np.array([data[0] for data in minibatch])).view(BATCH_SIZE,-1).float()
-    action_batch =t.from_numpy( np.array([data[1] for data in minibatch])).view(BATCH_SIZE,-1).float()
-    reward_batch = t.from_numpy(np.array([data[2] for data in minibatch])).view(BATCH_SIZE,-1).float()
-    next_state_batch = t.from_numpy(np.array([data[3] for data in minibatch])).view(BATCH_SIZE,-1).float()
-
-    # Step 2: calculate target 计算目标值
-    y_target = t.FloatTensor()
-    Q_value_batch = self.q_net(next_state_batch)  #利用网络计算下一个状态的价值
-    for i in range(0,BATCH_SIZE):
-      done = minibatch[i][4]
-      if done:
-        y_target=t.cat((y_target,reward_batch[i]),0)
-      else :  #下一状态价值*discount再加上reward就得到目标值
-        y_target=t.cat((y_target,reward_batch[i] + GAMMA * t.max(Q_value_batch[i])),0)
+    with self.profiler.timer('sample'):
+      state_batch,action_batch,reward_batch,next_state_batch,done_batch = self.sampler.sample(BATCH_SIZE)  #采样
 
-    #step 3:calculate current #计算实际值
-    y_2=self.q_net(state_batch)
-    y_currrent=y_2*action_batch
-    y_currrent=y_currrent.sum(1)
+    # Step 2: calculate target 计算目标值，整批一次算完，不保留计算图
+    with self.profiler.timer('forward'):
+      y_target = max_q_target(self.q_net,reward_batch,next_state_batch,done_batch,GAMMA)
+
+      #step 3:calculate current #计算实际值
+      y_currrent=q_selected(self.q_net(state_batch),action_batch)  #按动作下标取出Q(s,a)
 
     #反向传播更新参数
-    self.optimizer.zero_grad() # 梯度清零，等价于net.zero_grad()   
-    loss = self.criterion( y_currrent,y_target)
-    loss.backward()#反向传播得到梯度
+    with self.profiler.timer('backward'):
+      self.optimizer.zero_grad() # 梯度清零，等价于net.zero_grad()   
+      loss = self.criterion( y_currrent,y_target)
+      loss.backward()#反向传播得到梯度
 
     #查看step前后 参数的data和grad
     #print(self.q_net.layer2.weight.data,self.q_net.layer2.weight.grad)
-    self.optimizer.step()
+    with self.profiler.timer('optimizer'):
+      self.optimizer.step()
     #print(self.q_net.layer2.weight.data)
-    return loss
+    self.fast_q.refresh()
+    return loss.item()
 
   def egreedy_action(self,state):
-    state=t.from_numpy(state) #先把np转化成Tensor
-    state=state.float().view(1,4)
-    Q_value = self.q_net(state) #计算该状态的每个动作的价值
-    Q_value=Q_value.detach().numpy()
+    batch=np.ndim(state)==2 #向量化环境传入[N,state_dim]的一批状态
+    Q_value = self.fast_q(np.reshape(state,(-1,self.state_dim))) #计算该状态的每个动作的价值，numpy两次矩阵乘，不经过torch
     
     if self.epsilon>0.01:
-      self.epsilon *= 0.9999#epsilon随着迭代不断减小，使其更加接近target policy
+      self.epsilon *= 0.9999**len(Q_value)#epsilon随着迭代不断减小，使其更加接近target policy
     
+    if batch: #每个环境各自做e-greedy
+      actions=np.argmax(Q_value,axis=1)
+      explore=np.random.random(len(actions)) <= self.epsilon
+      actions[explore]=np.random.randint(0,self.action_dim,size=explore.sum())
+      return actions
     if random.random() <= self.epsilon:
         return random.randint(0,self.action_dim - 1)
     else:
         return np.argmax(Q_value)
 
   def action(self,state):
-    state=t.from_numpy(state).float().view(1,4)
-    Q_value=self.q_net(state) 
-    action=t.argmax(Q_value)  #只取价值最大的动作，没有随机的可能
-    return action.item()
+    Q_value=self.fast_q(state)
+    return int(np.argmax(Q_value))  #只取价值最大的动作，没有随机的可能
+
+  def close(self):
+    if self.learner is not None:
+      self.learner.close()
+    self.sampler.close()
+
+  def state_dict(self):
+    #网络、优化器、探索参数和经验池，足够从中断处原样继续训练
+    return {'q_net':self.q_net.state_dict(),
+            'optimizer':self.optimizer.state_dict(),
+            'epsilon':self.epsilon,
+            'time_step':self.time_step,
+            'replay_buffer':self.replay_buffer.state_dict()}
+
+  def load_state_dict(self,state):
+    self.q_net.load_state_dict(state['q_net'])
+    self.fast_q.refresh()
+    self.optimizer.load_state_dict(state['optimizer'])
+    self.epsilon=state['epsilon']
+    self.time_step=state['time_step']
+    self.replay_buffer.load_state_dict(state['replay_buffer'])
+
+class DQN_ensemble():
+  # K个独立的DQN叠成一个网络：每层一次bmm算完所有成员，成员之间不共享数据、梯度和超参数
+  # 成员k只用向量化环境里第k个环境的数据
+  def __init__(self, env):
+    self.k = env.num_envs
+    self.time_step = 0
+    self.epsilon = np.full(self.k,INITIAL_EPSILON)
+    self.state_dim = env.observation_space.shape[0]
+    self.action_dim = env.action_space.n
+    self.replay_buffer = EnsembleReplayBuffer(self.k,REPLAY_SIZE,self.state_dim,seeds=range(self.k))  #每个成员各自的采样随机流
+
+    self.q_net=EnsembleMLP(self.k,[self.state_dim,15,self.action_dim])  #和Q_net一样的结构，参数多一个成员维度
+    self.optimizer = EnsembleSGD(self.q_net.parameters(),lr=ENSEMBLE_LR)
+    self.gamma = t.tensor(np.broadcast_to(ENSEMBLE_GAMMA,(self.k,)),dtype=t.float32).view(-1,1)
+    self.profiler=Profiler(PROFILE,trace_updates=TRACE_UPDATES,trace_path=os.path.join(os.path.dirname(os.path.realpath(__file__)),'trace.json'))
+
+  def perceive(self,state,action,reward,next_state,done):
+    loss=np.zeros(self.k)
+    with self.profiler.timer('store'):
+      self.replay_buffer.store_batch(state,action,reward,next_state,done)
+    if len(self.replay_buffer) > BATCH_SIZE:
+      with self.profiler.update():
+        loss=self.train_Q_network()
+    return loss
+
+  def train_Q_network(self):
+    self.time_step += 1
+    with self.profiler.timer('sample'):
+      state_batch,action_batch,reward_batch,next_state_batch,done_batch = self.replay_buffer.sample(BATCH_SIZE)  #[K,B,...]
+
+    with self.profiler.timer('forward'):
+      with t.no_grad():
+        y_target = reward_batch + self.gamma * (1 - done_batch) * self.q_net(next_state_batch).max(2)[0]
+      y_currrent = self.q_net(state_batch).gather(2,action_batch.unsqueeze(2)).squeeze(2)
+      loss = ((y_currrent - y_target)**2).mean(1)  #每个成员自己的MSE
+
+    with self.profiler.timer('backward'):
+      self.optimizer.zero_grad()
+      loss.sum().backward()  #成员的参数互不相交，求和后各自拿到自己loss的梯度
+
+    with self.profiler.timer('optimizer'):
+      self.optimizer.step()
+    return loss.detach().numpy()
+
+  def egreedy_action(self,state):
+    with t.no_grad():
+      Q_value = self.q_net(t.as_tensor(state,dtype=t.float32).view(self.k,1,-1)).view(self.k,-1).numpy()
+    self.epsilon[self.epsilon>0.01] *= 0.9999
+    actions=np.argmax(Q_value,axis=1)
+    explore=np.random.random(self.k) <= self.epsilon
+    actions[explore]=np.random.randint(0,self.action_dim,size=explore.sum())
+    return actions
+
+  def member_net(self,k):
+    #把第k个成员拷回一个普通的Q_net，可以单独保存、测试
+    net=Q_net(self.state_dim,15,self.action_dim)
+    self.q_net.copy_member_to(k,[net.layer1,net.layer2])
+    return net
 
 # ---------------------------------------------------------
 # Hyper Parameters
@@ -123,19 +240,33 @@ ENV_NAME = 'CartPole-v0'
 EPISODE =2000 # Episode limitation
 #STEP = 300 # Step limitation in an episode 300步没啥用，坚持到了200步done为true自然就结束episode了
 TEST = 10 # The number of experiment test every 100 episode
+NUM_ENVS = 1 # >1 steps that many envs in worker processes
+CHECKPOINT_INTERVAL = 100 # episodes between resumable checkpoints, 0 turns them off
+CHECKPOINT_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)),'checkpoints')
+RECORD_DIR = None # directory to record every env transition into as an offline dataset (tools/train_offline.py)
+ENSEMBLE = 0 # >0: train that many independent agents as one batched network, one CartPoleVecEnv copy each
+ENSEMBLE_LR = 0.01 # learning rate, or a list with one per ensemble member
+ENSEMBLE_GAMMA = GAMMA # discount factor, or a list with one per ensemble member
 
-def main():
-  # initialize OpenAI Gym env and dqn agent
-  env = gym.make(ENV_NAME)  #生成环境
-  agent = DQN(env)
+def make_env():
+  if NUM_ENVS>1:  #多个环境放在子进程里并行step
+    return SubprocVecEnv([partial(gym.make,ENV_NAME) for _ in range(NUM_ENVS)])
+  return gym.make(ENV_NAME)  #生成环境
 
-  steps_per=[]
-  losses=[]
+def train(env,agent,metrics):
   count=0
   test_num=0
   is_converge=False
+  evaluator=AsyncEvaluator(partial(gym.make,ENV_NAME),agent.q_net,greedy_action,episodes=TEST)
   
-  for episode in range(EPISODE):
+  checkpointer=Checkpointer(CHECKPOINT_DIR,CHECKPOINT_INTERVAL)
+  start_episode=0
+  checkpoint=checkpointer.load()
+  if checkpoint is not None:  #从上次保存的checkpoint接着训练
+    agent.load_state_dict(checkpoint['agent'])
+    start_episode,count,test_num,is_converge=checkpoint['train']
+  metrics.log_start(start_episode)
+  for episode in range(start_episode,EPISODE):
     if test_num>15:
       break
     
@@ -144,12 +275,15 @@ def main():
     episode_loss=0
     while not is_converge:
       env.render()    # 刷新环境
-      action = agent.egreedy_action(state) # e-greedy action for train
+      with agent.profiler.timer('act'):
+        action = agent.egreedy_action(state) # e-greedy action for train
       if count>10 :
         is_converge=True
         break
       
-      next_state,reward,done,_ = env.step(action)
+      with agent.profiler.timer('env_step'):
+        next_state,reward,done,_ = env.step(action)
+        agent.profiler.count('env_step')
 
       '''x, x_dot, theta, theta_dot = next_state
       r1 = (env.x_threshold - abs(x))/env.x_threshold - 0.8
@@ -158,6 +292,7 @@ def main():
       #Define reward for agent
       #reward = -1 if done else reward
       loss=agent.perceive(state,action,reward,next_state,done)
+      agent.profiler.maybe_report()
       state = next_state
       
       steps=steps+1
@@ -171,34 +306,114 @@ def main():
         count=count+1
       else:
         count=0
-      losses.append(episode_loss/(steps+1))  
-      steps_per.append(steps)
+      metrics.log('episode',episode=episode,steps=steps,loss=episode_loss/(steps+1),epsilon=agent.epsilon)
       print('episode:',episode,'  steps ：',steps)
     # Test every 100 episodes
     if (episode+1) % 50 == 0:  #测试10次的平均reward，采用target policy
       if is_converge:
         test_num=test_num+1
 
-      total_reward = 0
-      for i in range(TEST):
-        state = env.reset()
-        while True:
-          env.render()
-          action = agent.action(state) # direct action for test
-          state,reward,done,_ = env.step(action)
-          total_reward += reward
-          if done:
-            break
-      ave_reward = total_reward/TEST
+      evaluator.submit(episode,agent.q_net)  #把当前参数交给后台进程测试，不阻塞训练
+    for test_episode,ave_reward in evaluator.poll():
       if ave_reward==200 :
         is_converge=True
-      print ('episode: ',episode,'Evaluation Average Reward:',ave_reward)
+      print ('episode: ',test_episode,'Evaluation Average Reward:',ave_reward)
+      metrics.log('eval',episode=test_episode,reward=float(ave_reward))
+    with agent.net_lock:  #learner线程不能在拷贝参数时更新
+      checkpointer.maybe_save(episode+1,lambda:{'agent':agent.state_dict(),
+                                                'train':[episode+1,count,test_num,is_converge]})
   
-  plt.plot(steps_per)
-  plt.plot(losses)
-  plt.show()
-  plt.savefig('learning_curve.png')
+  for test_episode,ave_reward in evaluator.close():
+    print ('episode: ',test_episode,'Evaluation Average Reward:',ave_reward)
+    metrics.log('eval',episode=test_episode,reward=float(ave_reward))
+  checkpointer.close()
+
+def train_vec(env,agent,metrics):
+  # 向量化环境：每次迭代所有环境各走一步，整批存入经验池
+  count=0
+  episode=0
+  metrics.log_start()
+  state = env.reset()
+  while episode<EPISODE and count<=10:
+    with agent.profiler.timer('act'):
+      action = agent.egreedy_action(state) # one e-greedy action per env
+    with agent.profiler.timer('env_step'):
+      next_state,reward,done,infos = env.step(action)
+      agent.profiler.count('env_step',env.num_envs)
+    loss=agent.perceive(state,action,reward,infos['final_obs'],done)
+    agent.profiler.maybe_report()
+    state = next_state
+
+    for steps in infos['episode_lengths'][done]:  #本次step中结束的episode
+      if steps==200:
+        count=count+1
+      else:
+        count=0
+      metrics.log('episode',episode=episode,steps=int(steps),loss=float(loss),epsilon=agent.epsilon)
+      print('episode:',episode,'  steps ：',steps)
+      episode=episode+1
+
+def train_ensemble(env,agent,metrics):
+  # 所有成员同步走一步、一起更新一次；每个成员各自数episode、判断收敛
+  counts=np.zeros(agent.k,dtype=np.int64)
+  episodes=np.zeros(agent.k,dtype=np.int64)
+  metrics.log_start()
+  state = env.reset()
+  while episodes.min()<EPISODE and (counts<=10).any():
+    with agent.profiler.timer('act'):
+      action = agent.egreedy_action(state) # one e-greedy action per member
+    with agent.profiler.timer('env_step'):
+      next_state,reward,done,infos = env.step(action)
+      agent.profiler.count('env_step',agent.k)
+    loss=agent.perceive(state,action,reward,infos['final_obs'],done)
+    agent.profiler.maybe_report()
+    state = next_state
+
+    for k in np.flatnonzero(done):  #本次step中结束episode的成员
+      steps=infos['episode_lengths'][k]
+      counts[k]=counts[k]+1 if steps==200 else 0
+      metrics.log('episode',episode=int(episodes[k]),steps=int(steps),loss=float(loss[k]),
+                  epsilon=float(agent.epsilon[k]),member=int(k))
+      print('member:',k,'episode:',episodes[k],'  steps ：',steps)
+      episodes[k]=episodes[k]+1
+
+def main_ensemble():
+  env = CartPoleVecEnv(ENSEMBLE)
+  agent = DQN_ensemble(env)
+  script_dir = os.path.dirname(os.path.realpath(__file__))
+  metrics = MetricsWriter(os.path.join(script_dir,'metrics.jsonl'))
+  train_ensemble(env,agent,metrics)
+  metrics.close()
+  env.close()
+
+  for k in range(agent.k):
+    t.save(agent.member_net(k),'DQN_%d.pkl' % k)
+  print('learning curves: python tools/plot_metrics.py',metrics.path,'--member K')
+
+def main(env=None):
+  # initialize OpenAI Gym env and dqn agent
+  # env can also be a vector env (SubprocVecEnv, CartPoleVecEnv) in place of gym.make(ENV_NAME)
+  if ENSEMBLE>0:
+    return main_ensemble()
+  if env is None:
+    env = make_env()
+  if RECORD_DIR:  #所有经过环境的transition都存成离线数据集，reward不做处理
+    env = RecordingEnv(env,RECORD_DIR)
+  #只有train会从checkpoint恢复，这时memmap经验池才复用已有文件
+  resume = CHECKPOINT_INTERVAL>0 and not hasattr(env,'num_envs') and latest_checkpoint(CHECKPOINT_DIR) is not None
+  agent = DQN(env,resume=resume)
+  script_dir = os.path.dirname(os.path.realpath(__file__))
+  metrics = MetricsWriter(os.path.join(script_dir,'metrics.jsonl'))  #训练过程边跑边写文件，画图交给tools/plot_metrics.py
+  if hasattr(env,'num_envs'):
+    train_vec(env,agent,metrics)
+  else:
+    train(env,agent,metrics)
+  metrics.close()
+  agent.close()
+  env.close()
+
   t.save(agent.q_net,'DQN.pkl')
+  print('learning curves: python tools/plot_metrics.py',metrics.path)
 
 if __name__ == '__main__':
   main()
\ No newline at end of file
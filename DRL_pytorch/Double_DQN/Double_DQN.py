@@ -14,16 +14,32 @@ from torch import nn
 from torch import  optim
 import numpy as np
 import random
-from collections import deque
-import matplotlib.pyplot as plt
-import copy
+import threading
+from functools import partial
 import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from common.checkpoint import Checkpointer
+from common.compact_replay import CompactReplayBuffer
+from common.dataset import RecordingEnv
+from common.evaluator import AsyncEvaluator,greedy_action
+from common.learner_thread import LearnerThread
+from common.metrics import MetricsWriter
+from common.profiler import Profiler
+from common.replay_buffer import ReplayBuffer
+from common.target_sync import TargetSync
+from common.td_target import double_q_target,q_selected
 t.set_default_tensor_type(t.FloatTensor)
 # Hyper Parameters for DQN
 GAMMA = 0.9 # discount factor for target Q
 INITIAL_EPSILON = 0.5 # starting value of epsilon
 REPLAY_SIZE = 10000 # experience replay buffer size
+COMPACT_REPLAY = False # True: observations stored once as float16, uint8 actions, bit-packed dones
 BATCH_SIZE = 32 # size of minibatch
+PROFILE = False # print env steps/s, updates/s and per-phase time shares every 10 s
+TRACE_UPDATES = None # (first, n): torch.profiler chrome trace of n updates, written next to the script
+LEARNER_THREAD = False # True: a background thread trains while the main thread steps the env
+REPLAY_RATIO = 1. # learner updates per env step with LEARNER_THREAD, None: as many as it can
 UPDATE_FREQUENCY=10
 
 class Q_net(nn.Module):
@@ -39,86 +55,93 @@ class Q_net(nn.Module):
 class Nature_DQN():
   # DQN Agent
   def __init__(self, env):
-    # init experience replay
-    self.replay_buffer = deque()  #经验池
     # init some parameters
     self.time_step = 0
     self.epsilon = INITIAL_EPSILON
     self.state_dim = env.observation_space.shape[0]
     self.action_dim = env.action_space.n
+    if COMPACT_REPLAY:  #每个状态只存一份，s'从下一个槽位读出；向量化环境每个env一条独立的环
+      self.replay_buffer = CompactReplayBuffer(REPLAY_SIZE,self.state_dim,streams=getattr(env,'num_envs',1))
+    else:
+      self.replay_buffer = ReplayBuffer(REPLAY_SIZE,self.state_dim)  # init experience replay 经验池
 
     self.current_net=Q_net(self.state_dim,20,self.action_dim)#定义网络及优化器和损失函数
     self.optimizer = optim.SGD(params=self.current_net.parameters(), lr=0.01)
     self.criterion = nn.MSELoss()
 
     self.target_net=Q_net(self.state_dim,20,self.action_dim)
+    self.target_sync=TargetSync(self.current_net,self.target_net)  #两个网络的参数各放进一块连续内存
+    self.profiler=Profiler(PROFILE,trace_updates=TRACE_UPDATES,trace_path=os.path.join(os.path.dirname(os.path.realpath(__file__)),'trace.json'))
+    self.net_lock=threading.Lock()  #学习时一直持有，同步目标网络、存checkpoint时也要拿，两个线程不会同时改网络
+    self.learner=None
 
   def perceive(self,state,action,reward,next_state,done):
     loss=0.0
-    one_hot_action = np.zeros(self.action_dim)  #将动作变为[0,1] [1,0]形式
-    one_hot_action[action] = 1
-    self.replay_buffer.append((state,one_hot_action,reward,next_state,done))#将S A R S A存入经验池
-    
-    if len(self.replay_buffer) > REPLAY_SIZE: #超过经验池的容量则开始舍弃最老的
-      self.replay_buffer.popleft()
+    with self.profiler.timer('store'):
+      if np.ndim(reward)>0: #向量化环境一次传入一批transition
+        self.replay_buffer.store_batch(state,action,reward,next_state,done)
+      else:
+        self.replay_buffer.store(state,action,reward,next_state,done)#将S A R S A存入经验池，满了自动覆盖最老的
 
+    if LEARNER_THREAD:  #后台线程负责训练，这里只报告走了几步
+      if self.learner is None:
+        self.learner=LearnerThread(self.learn_step,lambda:len(self.replay_buffer) > BATCH_SIZE,REPLAY_RATIO)
+      self.learner.add_steps(np.size(reward))
+      return self.learner.loss
     if len(self.replay_buffer) > BATCH_SIZE:#经验池已有样本超过size就开始采样训练
-      loss=self.train_Q_network()
+      loss=self.learn_step()
 
     return loss
 
+  def learn_step(self):
+    with self.net_lock,self.profiler.update():
+      return self.train_Q_network()
+
   def train_Q_network(self):
     self.time_step += 1
     # Step 1: obtain random minibatch from replay memory
-    minibatch = random.sample(self.replay_buffer,BATCH_SIZE)  #采样
-
-    state_batch = t.tensor([data[0] for data in minibatch]).float()
-    action_batch =t.tensor( [data[1] for data in minibatch]).view(BATCH_SIZE,-1).float()
-    reward_batch = t.tensor([data[2] for data in minibatch]).view(BATCH_SIZE,-1).float()
-    next_state_batch = t.tensor([data[3] for data in minibatch]).float()
+    with self.profiler.timer('sample'),self.replay_buffer.lock:  #行动线程可能正在写同一批数组
+      state_batch,action_batch,reward_batch,next_state_batch,done_batch = self.replay_buffer.sample(BATCH_SIZE)  #采样
 
     #step 2:calculate current #计算实际值
-    y_2=self.current_net(state_batch)
-    max_action=y_2.argmax(dim=1)
-    y_currrent=y_2*action_batch
-    y_currrent=y_currrent.sum(1)
+    with self.profiler.timer('forward'):
+      y_currrent=q_selected(self.current_net(state_batch),action_batch)  #按动作下标取出Q(s,a)
     
-    # Step 3: calculate target 计算目标值
-    y_target = t.FloatTensor()
-    Q_value_batch = self.target_net(next_state_batch)  #利用网络计算下一个状态的价值
-    for i in range(0,BATCH_SIZE):
-      done = minibatch[i][4]
-      if done:
-        y_target=t.cat((y_target,reward_batch[i]),0)
-      else :  #下一状态价值*discount再加上reward就得到目标值
-        action=max_action[i]
-        y_target=t.cat((y_target,reward_batch[i] + GAMMA * Q_value_batch[i][action]),0)
-
-
+      # Step 3: calculate target 计算目标值，当前网络选动作，目标网络估值
+      y_target = double_q_target(self.current_net,self.target_net,reward_batch,next_state_batch,done_batch,GAMMA)
 
     #反向传播更新参数
-    self.optimizer.zero_grad() # 梯度清零，等价于net.zero_grad()   
-    loss = self.criterion( y_currrent,y_target.detach())
-    loss.backward()#反向传播得到梯度
+    with self.profiler.timer('backward'):
+      self.optimizer.zero_grad() # 梯度清零，等价于net.zero_grad()   
+      loss = self.criterion( y_currrent,y_target)
+      loss.backward()#反向传播得到梯度
 
     #查看step前后 参数的data和grad
     #print(self.target_net.layer2.weight.data,self.target_net.layer2.weight.grad)
-    self.optimizer.step()
+    with self.profiler.timer('optimizer'):
+      self.optimizer.step()
     #print(self.target_net.layer2.weight.data,self.current_net.layer2.weight.grad)
-    return loss
+    return loss.item()
 
   def update_target_net(self):
-    self.target_net=copy.deepcopy(self.current_net)
+    with self.net_lock,self.profiler.timer('target_sync'):
+      self.target_sync.hard_update()  #原地拷贝，不再每次deepcopy出一个新网络
 
   def egreedy_action(self,state):
+    batch=np.ndim(state)==2 #向量化环境传入[N,state_dim]的一批状态
     state=t.from_numpy(state) #先把np转化成Tensor
-    state=state.float().view(1,4)
+    state=state.float().view(-1,self.state_dim)
     Q_value = self.current_net(state) #计算该状态的每个动作的价值
     Q_value=Q_value.detach().numpy()
 
     if self.epsilon>0.01:
-      self.epsilon *= 0.9999#epsilon随着迭代不断减小，使其更加接近target policy
+      self.epsilon *= 0.9999**len(Q_value)#epsilon随着迭代不断减小，使其更加接近target policy
     
+    if batch: #每个环境各自做e-greedy
+      actions=np.argmax(Q_value,axis=1)
+      explore=np.random.random(len(actions)) <= self.epsilon
+      actions[explore]=np.random.randint(0,self.action_dim,size=explore.sum())
+      return actions
     if random.random() <= self.epsilon:
         return random.randint(0,self.action_dim - 1)
     else:
@@ -130,23 +153,56 @@ class Nature_DQN():
     action=t.argmax(Q_value)  #只取价值最大的动作，没有随机的可能
     return action.item()
 
+  def close(self):
+    if self.learner is not None:
+      self.learner.close()
+
+  def state_dict(self):
+    #网络、优化器、探索参数和经验池，足够从中断处原样继续训练
+    return {'current_net':self.current_net.state_dict(),
+            'target_net':self.target_net.state_dict(),
+            'optimizer':self.optimizer.state_dict(),
+            'epsilon':self.epsilon,
+            'time_step':self.time_step,
+            'replay_buffer':self.replay_buffer.state_dict()}
+
+  def load_state_dict(self,state):
+    self.current_net.load_state_dict(state['current_net'])
+    self.target_net.load_state_dict(state['target_net'])
+    self.optimizer.load_state_dict(state['optimizer'])
+    self.epsilon=state['epsilon']
+    self.time_step=state['time_step']
+    self.replay_buffer.load_state_dict(state['replay_buffer'])
+
 # ---------------------------------------------------------
 # Hyper Parameters
 ENV_NAME = 'CartPole-v0'
 EPISODE =1000 # Episode limitation
 TEST = 10 # The number of experiment test every 100 episode
+CHECKPOINT_INTERVAL = 100 # episodes between resumable checkpoints, 0 turns them off
+RECORD_DIR = None # directory to record every env transition into as an offline dataset (tools/train_offline.py)
 
 def main():
   # initialize OpenAI Gym env and dqn agent
   env = gym.make(ENV_NAME)  #生成环境
+  if RECORD_DIR:  #所有经过环境的transition都存成离线数据集，reward不做处理
+    env = RecordingEnv(env,RECORD_DIR)
   agent = Nature_DQN(env)
-   
-  steps_per=[]
-  losses=[]
+  script_path = os.path.realpath(__file__)
+  script_dir = os.path.dirname(script_path)
+  metrics = MetricsWriter(os.path.join(script_dir,'metrics.jsonl'))  #训练过程边跑边写文件，画图交给tools/plot_metrics.py
   count=0
   test_num=0
   is_converge=False
-  for episode in range(EPISODE):
+  evaluator=AsyncEvaluator(partial(gym.make,ENV_NAME),agent.target_net,greedy_action,episodes=TEST)
+  checkpointer=Checkpointer(os.path.join(os.path.dirname(os.path.realpath(__file__)),'checkpoints'),CHECKPOINT_INTERVAL)
+  start_episode=0
+  checkpoint=checkpointer.load()
+  if checkpoint is not None:  #从上次保存的checkpoint接着训练
+    agent.load_state_dict(checkpoint['agent'])
+    start_episode,count,test_num,is_converge=checkpoint['train']
+  metrics.log_start(start_episode)
+  for episode in range(start_episode,EPISODE):
     if test_num>10:
       break
     
@@ -155,13 +211,16 @@ def main():
     episode_loss=0
     while not is_converge:
       env.render()    # 刷新环境
-      action = agent.egreedy_action(state) # e-greedy action for train
+      with agent.profiler.timer('act'):
+        action = agent.egreedy_action(state) # e-greedy action for train
       if count>20 :
         is_converge=True
         agent.update_target_net()
         break
       
-      next_state,reward,done,_ = env.step(action)
+      with agent.profiler.timer('env_step'):
+        next_state,reward,done,_ = env.step(action)
+        agent.profiler.count('env_step')
 
       #x, x_dot, theta, theta_dot = next_state
       #r1 = (env.x_threshold - abs(x))/env.x_threshold - 0.8
@@ -170,6 +229,7 @@ def main():
       # Define reward for agent
       reward = -1 if done else reward
       loss=agent.perceive(state,action,reward,next_state,done)
+      agent.profiler.maybe_report()
       state = next_state
       
       steps=steps+1
@@ -183,8 +243,7 @@ def main():
         count=count+1
       else:
         count=0
-      losses.append(episode_loss/(steps+1))  
-      steps_per.append(steps)
+      metrics.log('episode',episode=episode,steps=steps,loss=episode_loss/(steps+1),epsilon=agent.epsilon)
       print('episode:',episode,'  steps ：',steps)
 
     if (episode+1) % UPDATE_FREQUENCY == 0:
@@ -195,34 +254,23 @@ def main():
       if is_converge:
         test_num=test_num+1
 
-      total_reward = 0
-      for i in range(TEST):
-        state = env.reset()
-        while True:
-          env.render()
-          action = agent.action(state) # direct action for test
-          state,reward,done,_ = env.step(action)
-          total_reward += reward
-          if done:
-            break
-      ave_reward = total_reward/TEST
-      print ('episode: ',episode,'Evaluation Average Reward:',ave_reward)
+      evaluator.submit(episode,agent.target_net)  #把当前参数交给后台进程测试，不阻塞训练
+    for test_episode,ave_reward in evaluator.poll():
+      print ('episode: ',test_episode,'Evaluation Average Reward:',ave_reward)
+      metrics.log('eval',episode=test_episode,reward=float(ave_reward))
+    with agent.net_lock:  #learner线程不能在拷贝参数时更新
+      checkpointer.maybe_save(episode+1,lambda:{'agent':agent.state_dict(),
+                                                'train':[episode+1,count,test_num,is_converge]})
   
-  fig=plt.figure()
-  ax1=fig.add_subplot(111)
-  ax1.plot(steps_per,'b')
-  ax1.set_ylabel('steps in each episode')
-  ax1.set_title("leaning curves")
-
-  ax2 = ax1.twinx()
-  ax2.plot(losses,'r')
-  ax2.set_ylabel('average loss of steps in each episode')
-  #plt.show()
+  for test_episode,ave_reward in evaluator.close():
+    print ('episode: ',test_episode,'Evaluation Average Reward:',ave_reward)
+    metrics.log('eval',episode=test_episode,reward=float(ave_reward))
+  checkpointer.close()
+  metrics.close()
+  agent.close()
+  env.close()  #录制数据集时写出最后一个shard
 
-  script_path = os.path.realpath(__file__)
-  script_dir = os.path.dirname(script_path)
-  path=script_dir+'\\learning_curve.png'
-  plt.savefig(path,dpi=1200)
-  t.save(agent.target_net,script_dir+'\\net_model.pkl')
+  t.save(agent.target_net,os.path.join(script_dir,'net_model.pkl'))
+  print('learning curves: python tools/plot_metrics.py',metrics.path)
 if __name__ == '__main__':
   main()
\ No newline at end of file
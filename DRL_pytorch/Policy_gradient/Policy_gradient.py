@@ -11,8 +11,17 @@
 import gym
 import torch as t
 import numpy as np
-import matplotlib.pyplot as plt
+from functools import partial
 import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from common.checkpoint import Checkpointer
+from common.dataset import RecordingEnv
+from common.evaluator import AsyncEvaluator,sample_action
+from common.metrics import MetricsWriter
+from common.profiler import Profiler
+from common.returns import discounted_returns,pad_episodes
+from common.subproc_vec_env import SubprocVecEnv
 
 GAMMA = 0.9 # discount factor
 t.set_default_tensor_type(t.DoubleTensor)
@@ -39,44 +48,53 @@ class Policy_gradient():
     self.states=[]
     self.actions=[]
     self.rewards=[]
+    self.episodes=[]  # finished episodes waiting for learn()
 
     self.net=Policy_net(self.state_dim,20,self.action_dim)
     self.optimizer = t.optim.Adam(params=self.net.parameters(), lr=0.01)
+    self.profiler=Profiler(PROFILE,trace_updates=TRACE_UPDATES,trace_path=os.path.join(os.path.dirname(os.path.realpath(__file__)),'trace.json'))
+
+  def finish_episode(self):
+    #当前episode的轨迹整条放进episodes，等凑够BATCH_EPISODES条一起learn
+    self.episodes.append((self.states,self.actions,self.rewards))
+    self.states=[]
+    self.actions=[]
+    self.rewards=[]
 
   def learn(self):
-    returns=np.zeros_like(self.rewards)
-    return_t=0
-    for step in reversed(range(0,len(self.rewards)-1)):
-        return_t=GAMMA*return_t+self.rewards[step]
-        returns[step]=return_t
-    returns=(returns-np.mean(returns))/np.std(returns)
-
-    returns=t.tensor(returns)
-    states=t.tensor(self.states)
-    actions=t.zeros((len(self.actions),2))
-    for i in range(len(self.actions)):
-        actions[i][self.actions[i]]=1
-
-    action_probabilities=self.net(states)
-    neg_log_prob=t.sum(-t.log(action_probabilities)*actions,1)
-    loss=t.sum(neg_log_prob*returns)
-
-    self.optimizer.zero_grad()
-    loss.backward()
+    #所有episode补齐成[B,T]一次算完回报，不再逐条逐步地倒序循环
+    with self.profiler.timer('forward'):
+      rewards,mask=pad_episodes([episode[2] for episode in self.episodes])
+      returns=discounted_returns(rewards,GAMMA)[mask]
+      returns=(returns-np.mean(returns))/np.std(returns)
+
+      returns=t.tensor(returns)
+      states=t.tensor(np.concatenate([episode[0] for episode in self.episodes]))
+      actions=t.tensor(np.concatenate([episode[1] for episode in self.episodes])).view(-1,1)
+
+      action_probabilities=self.net(states)
+      neg_log_prob=-t.log(action_probabilities.gather(1,actions)).view(-1)
+      loss=t.sum(neg_log_prob*returns)
+
+    with self.profiler.timer('backward'):
+      self.optimizer.zero_grad()
+      loss.backward()
     #查看step前后 参数的data和grad
     #print(self.net.hidden_preference.weight.data,self.net.hidden_preference.weight.grad)
-    self.optimizer.step()
+    with self.profiler.timer('optimizer'):
+      self.optimizer.step()
     #print(self.net.hidden_preference.weight.data)
 
-    self.rewards.clear()
-    self.states.clear()
-    self.actions.clear()
-    return loss
+    self.episodes.clear()
+    return loss.item()
 
   def choose_action(self,state):
-    state=t.tensor(state).view(1,-1)
+    batch=np.ndim(state)==2 #向量化环境传入[N,state_dim]的一批状态
+    state=t.tensor(state).view(-1,self.state_dim)
     action_probabilities=self.net(state)
     action=t.distributions.Categorical(action_probabilities).sample()
+    if batch:
+      return action.numpy()
     return action.item()
 
   def store_transition(self,state,action,reward):
@@ -84,25 +102,47 @@ class Policy_gradient():
     self.actions.append(action)
     self.rewards.append(reward)
 
+  def state_dict(self):
+    #网络和优化器的状态，足够从中断处原样继续训练
+    return {'net':self.net.state_dict(),
+            'optimizer':self.optimizer.state_dict()}
+
+  def load_state_dict(self,state):
+    self.net.load_state_dict(state['net'])
+    self.optimizer.load_state_dict(state['optimizer'])
+
 # ---------------------------------------------------------
 # Hyper Parameters
 ENV_NAME = 'CartPole-v0'
 EPISODE =1000 # Episode limitation
 #STEP = 300 # Step limitation in an episode 300步没啥用，坚持到了200步done为true自然就结束episode了
 TEST = 10 # The number of experiment test every 100 episode
+NUM_ENVS = 1 # >1 steps that many envs in worker processes
+BATCH_EPISODES = 1 # episodes per policy update
+CHECKPOINT_INTERVAL = 100 # episodes between resumable checkpoints, 0 turns them off
+RECORD_DIR = None # directory to record every env transition into as an offline dataset (tools/train_offline.py)
+PROFILE = False # print env steps/s, updates/s and per-phase time shares every 10 s
+TRACE_UPDATES = None # (first, n): torch.profiler chrome trace of n updates, written next to the script
 
-def main():
-  # initialize OpenAI Gym env and dqn agent
-  env = gym.make(ENV_NAME)  #生成环境
-  agent = Policy_gradient(env)
+def make_env():
+  if NUM_ENVS>1:  #多个环境放在子进程里并行step
+    return SubprocVecEnv([partial(gym.make,ENV_NAME) for _ in range(NUM_ENVS)])
+  return gym.make(ENV_NAME)  #生成环境
 
-  steps_per=[]
-  losses=[]
+def train(env,agent,metrics):
   count=0
   test_num=0
   is_converge=False
+  evaluator=AsyncEvaluator(partial(gym.make,ENV_NAME),agent.net,sample_action,episodes=TEST)
   
-  for episode in range(EPISODE):
+  checkpointer=Checkpointer(os.path.join(os.path.dirname(os.path.realpath(__file__)),'checkpoints'),CHECKPOINT_INTERVAL)
+  start_episode=0
+  checkpoint=checkpointer.load()
+  if checkpoint is not None:  #从上次保存的checkpoint接着训练
+    agent.load_state_dict(checkpoint['agent'])
+    start_episode,count,test_num,is_converge=checkpoint['train']
+  metrics.log_start(start_episode)
+  for episode in range(start_episode,EPISODE):
     if test_num>10:
       break
     
@@ -111,10 +151,14 @@ def main():
     episode_loss=0
     while not is_converge:
         env.render()    # 刷新环境
-        action = agent.choose_action(state) # e-greedy action for train
+        with agent.profiler.timer('act'):
+          action = agent.choose_action(state) # e-greedy action for train
 
-        next_state,reward,done,_ = env.step(action)
+        with agent.profiler.timer('env_step'):
+          next_state,reward,done,_ = env.step(action)
+          agent.profiler.count('env_step')
         agent.store_transition(state,action,reward)    
+        agent.profiler.maybe_report()
 
         '''x, x_dot, theta, theta_dot = next_state
         r1 = (env.x_threshold - abs(x))/env.x_threshold - 0.8
@@ -125,7 +169,10 @@ def main():
         
         steps=steps+1   
         if done:
-            episode_loss=agent.learn()
+            agent.finish_episode()
+            if len(agent.episodes)>=BATCH_EPISODES:
+              with agent.profiler.update():
+                episode_loss=agent.learn()
             break
 
     if not is_converge:
@@ -135,43 +182,81 @@ def main():
                 is_converge=True
         else:
             count=0
-        losses.append(episode_loss/(steps+1))  
-        steps_per.append(steps)
+        metrics.log('episode',episode=episode,steps=steps,loss=episode_loss/(steps+1))
         print('episode:',episode,'  steps ：',steps)
     # Test every 100 episodes
     if (episode+1) % 30 == 0:  #测试10次的平均reward，采用target policy
       if is_converge:
         test_num=test_num+1
 
-      total_reward = 0
-      for i in range(TEST):
-        state = env.reset()
-        while True:
-          env.render()
-          action = agent.choose_action(state) # direct action for test
-          state,reward,done,_ = env.step(action)
-          total_reward += reward
-          if done:
-            break
-      ave_reward = total_reward/TEST
-      print ('episode: ',episode,'Evaluation Average Reward:',ave_reward)
+      evaluator.submit(episode,agent.net)  #把当前参数交给后台进程测试，不阻塞训练
+    for test_episode,ave_reward in evaluator.poll():
+      print ('episode: ',test_episode,'Evaluation Average Reward:',ave_reward)
+      metrics.log('eval',episode=test_episode,reward=float(ave_reward))
+    checkpointer.maybe_save(episode+1,lambda:{'agent':agent.state_dict(),
+                                              'train':[episode+1,count,test_num,is_converge]})
   
-  fig=plt.figure()
-  ax1=fig.add_subplot(111)
-  ax1.plot(steps_per,'b')
-  ax1.set_ylabel('steps in each episode')
-  ax1.set_title("leaning curves")
+  for test_episode,ave_reward in evaluator.close():
+    print ('episode: ',test_episode,'Evaluation Average Reward:',ave_reward)
+    metrics.log('eval',episode=test_episode,reward=float(ave_reward))
+  checkpointer.close()
 
-  ax2 = ax1.twinx()
-  ax2.plot(losses,'r')
-  ax2.set_ylabel('average loss of steps in each episode')
-  #plt.show()
+def train_vec(env,agent,metrics):
+  # 向量化环境：各环境的轨迹分别记录，某个环境的episode结束时用它的整条轨迹更新一次
+  count=0
+  episode=0
+  metrics.log_start()
+  trajectories=[([],[],[]) for _ in range(env.num_envs)]
+  loss=0
+  state = env.reset()
+  while episode<EPISODE and count<=25:
+    with agent.profiler.timer('act'):
+      action = agent.choose_action(state) # one sampled action per env
+    with agent.profiler.timer('env_step'):
+      next_state,reward,done,infos = env.step(action)
+      agent.profiler.count('env_step',env.num_envs)
+    for i in range(env.num_envs):
+      trajectories[i][0].append(state[i])
+      trajectories[i][1].append(action[i])
+      trajectories[i][2].append(reward[i])
+    state = next_state
+    agent.profiler.maybe_report()
 
+    for i in np.flatnonzero(done):  #本次step中结束的episode
+      agent.episodes.append(trajectories[i])
+      trajectories[i]=([],[],[])
+      steps=infos['episode_lengths'][i]
+      if len(agent.episodes)>=BATCH_EPISODES:
+        with agent.profiler.update():
+          loss=agent.learn()
+      if steps==200:
+        count=count+1
+      else:
+        count=0
+      metrics.log('episode',episode=episode,steps=int(steps),loss=float(loss)/(steps+1))
+      print('episode:',episode,'  steps ：',steps)
+      episode=episode+1
+
+def main(env=None):
+  # initialize OpenAI Gym env and policy gradient agent
+  # env can also be a vector env (SubprocVecEnv, CartPoleVecEnv) in place of gym.make(ENV_NAME)
+  if env is None:
+    env = make_env()
+  if RECORD_DIR:  #所有经过环境的transition都存成离线数据集，reward不做处理
+    env = RecordingEnv(env,RECORD_DIR)
+  agent = Policy_gradient(env)
   script_path = os.path.realpath(__file__)
   script_dir = os.path.dirname(script_path)
-  path=script_dir+'\\learning_curve.png'
-  plt.savefig(path,dpi=1200)
-  t.save(agent.net,script_dir+'\\net_model.pkl')
+  metrics = MetricsWriter(os.path.join(script_dir,'metrics.jsonl'))  #训练过程边跑边写文件，画图交给tools/plot_metrics.py
+  if hasattr(env,'num_envs'):
+    train_vec(env,agent,metrics)
+  else:
+    train(env,agent,metrics)
+  metrics.close()
+  env.close()
+
+  t.save(agent.net,os.path.join(script_dir,'net_model.pkl'))
+  print('learning curves: python tools/plot_metrics.py',metrics.path)
 
 if __name__ == '__main__':
   main()
\ No newline at end of file
@@ -0,0 +1,58 @@
+import queue
+import torch.multiprocessing as mp
+
+
+def actor_epsilons(n, base=0.4, alpha=7.):
+    """
+    Ape-X exploration schedule: actor i of n explores with epsilon = base ** (1 + alpha * i / (n - 1)),
+    from base for actor 0 down to base ** (1 + alpha) for the last one.
+    """
+    if n == 1:
+        return [base]
+    return [base ** (1 + alpha * i / (n - 1)) for i in range(n)]
+
+def drain(q, wait=False, timeout=0.1):
+    """
+    Everything currently in q, without blocking. wait=True first waits up to timeout for one item.
+    """
+    items = []
+    if wait:
+        try:
+            items.append(q.get(timeout=timeout))
+        except queue.Empty:
+            return items
+    while True:
+        try:
+            items.append(q.get_nowait())
+        except queue.Empty:
+            return items
+
+
+class SharedWeights(object):
+    """
+    Weight broadcast from the learner to actor processes. Keeps a copy of the parameters and buffers
+    of every given net in shared memory, so it must be created before the actors start.
+    publish(nets) copies the learner's nets in and bumps the version; pull(nets, version) copies them
+    into an actor's nets if a newer version was published and returns the version the nets now hold.
+    Both hold the version's lock, so an actor never reads half-written weights.
+    """
+
+    def __init__(self, nets):
+        self.tensors = [[v.detach().clone().share_memory_() for v in net.state_dict().values()] for net in nets]
+        self.version = mp.Value('l', 0)
+
+    def publish(self, nets):
+        with self.version.get_lock():
+            for shared, net in zip(self.tensors, nets):
+                for s, v in zip(shared, net.state_dict().values()):
+                    s.copy_(v)
+            self.version.value += 1
+
+    def pull(self, nets, version=-1):
+        with self.version.get_lock():
+            if self.version.value == version:
+                return version
+            for shared, net in zip(self.tensors, nets):
+                for s, v in zip(shared, net.state_dict().values()):
+                    v.copy_(s)
+            return self.version.value
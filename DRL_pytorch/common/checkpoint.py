@@ -0,0 +1,159 @@
+import os
+import queue
+import shutil
+import threading
+import numpy as np
+import torch as t
+
+
+def _snapshot(obj):
+    """
+    Copy of a nested dict/list/tuple of tensors, arrays and python scalars, taken on the caller's thread
+    so training can go on mutating nets and buffers while the copy is written.
+    """
+    if isinstance(obj, dict):
+        return {k: _snapshot(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_snapshot(v) for v in obj]
+    if isinstance(obj, t.Tensor):
+        return obj.detach().clone()
+    if isinstance(obj, np.ndarray):
+        return obj.copy()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    return obj
+
+def _split_arrays(obj, path, arrays):
+    # numpy arrays go to their own .npy file, a {'__npy__': file} marker takes their place
+    if isinstance(obj, dict):
+        return {k: _split_arrays(v, path + [str(k)], arrays) for k, v in obj.items()}
+    if isinstance(obj, list):
+        return [_split_arrays(v, path + [str(i)], arrays) for i, v in enumerate(obj)]
+    if isinstance(obj, np.ndarray):
+        name = '.'.join(path) + '.npy'
+        arrays[name] = obj
+        return {'__npy__': name}
+    return obj
+
+def _join_arrays(obj, directory, mmap_mode):
+    if isinstance(obj, dict):
+        if set(obj) == {'__npy__'}:
+            return np.load(os.path.join(directory, obj['__npy__']), mmap_mode=mmap_mode)
+        return {k: _join_arrays(v, directory, mmap_mode) for k, v in obj.items()}
+    if isinstance(obj, list):
+        return [_join_arrays(v, directory, mmap_mode) for v in obj]
+    return obj
+
+def latest_checkpoint(directory):
+    """
+    Path of the checkpoint the `latest` file of directory points to, None if there is none.
+    Lets a script know it will resume before it builds what a checkpoint restores (e.g. replay files).
+    """
+    try:
+        with open(os.path.join(directory, 'latest')) as f:
+            name = f.read().strip()
+    except FileNotFoundError:
+        return None
+    path = os.path.join(directory, name)
+    return path if os.path.isdir(path) else None
+
+
+class Checkpointer(object):
+    """
+    Writes full training state to directory/ckpt_<tag>/ in a background thread.
+    state is a nested dict of state_dicts, tensors, numpy arrays and scalars: tensors and scalars go to
+    state.pt, every numpy array (replay memory) to its own raw .npy file, so load() can memory-map them.
+    A checkpoint is written under a temporary name and renamed when complete, then the `latest`
+    file is replaced to point at it: a crash mid-write leaves the previous checkpoint in place.
+    Only the newest `keep` checkpoints are kept. interval=0 turns checkpointing (and resuming) off.
+    If a write fails (disk full, a field that cannot be pickled ...) the error is re-raised by the next
+    save()/maybe_save()/close(); the worker keeps taking snapshots, so the caller never blocks on it.
+    """
+
+    def __init__(self, directory, interval=100, keep=2):
+        self.directory = directory
+        self.interval = interval
+        self.keep = keep
+        self.jobs = queue.Queue(maxsize=1)  # at most one snapshot waits behind the one being written
+        self.error = None
+        self.thread = threading.Thread(target=self._work, daemon=True)
+        self.thread.start()
+
+    def _raise_error(self):
+        error, self.error = self.error, None
+        if error is not None:
+            raise error
+
+    def save(self, tag, state):
+        self._raise_error()
+        self.jobs.put((tag, _snapshot(state)))
+
+    def maybe_save(self, episode, state_fn):
+        """
+        Saves state_fn() every `interval` episodes; state_fn is only called when a checkpoint is due.
+        """
+        self._raise_error()
+        if self.interval and episode % self.interval == 0:
+            self.save(episode, state_fn())
+
+    def latest(self):
+        return latest_checkpoint(self.directory)
+
+    def load(self, path=None, mmap=True):
+        """
+        Returns the state saved in path (default: the latest checkpoint), or None if there is none.
+        With mmap the arrays are read-only memory maps, copy them into the live buffers.
+        """
+        if path is None:
+            if not self.interval:
+                return None
+            path = self.latest()
+            if path is None:
+                return None
+        state = t.load(os.path.join(path, 'state.pt'))
+        return _join_arrays(state, path, 'r' if mmap else None)
+
+    def close(self):
+        """
+        Waits until the checkpoints already queued are on disk, re-raises a write that failed.
+        """
+        self.jobs.put(None)
+        self.thread.join()
+        self._raise_error()
+
+    def _work(self):
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                break
+            try:
+                self._write(*job)
+            except Exception as e:  # kept for the caller, a dead worker would leave save() blocked on the queue
+                self.error = e
+
+    def _write(self, tag, state):
+        os.makedirs(self.directory, exist_ok=True)
+        name = 'ckpt_%08d' % tag if isinstance(tag, int) else 'ckpt_%s' % tag
+        final = os.path.join(self.directory, name)
+        tmp = final + '.tmp'
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+
+        arrays = {}
+        state = _split_arrays(state, [], arrays)
+        for file_name, array in arrays.items():
+            np.save(os.path.join(tmp, file_name), array)
+        t.save(state, os.path.join(tmp, 'state.pt'))
+        shutil.rmtree(final, ignore_errors=True)
+        os.rename(tmp, final)
+
+        pointer = os.path.join(self.directory, 'latest')
+        with open(pointer + '.tmp', 'w') as f:
+            f.write(name)
+        os.replace(pointer + '.tmp', pointer)
+
+        checkpoints = sorted(d for d in os.listdir(self.directory)
+                             if d.startswith('ckpt_') and not d.endswith('.tmp'))
+        for old in checkpoints[:-self.keep]:
+            if old != name:
+                shutil.rmtree(os.path.join(self.directory, old), ignore_errors=True)
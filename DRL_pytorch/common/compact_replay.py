@@ -0,0 +1,151 @@
+import threading
+import numpy as np
+import torch as t
+
+
+def _encode_bfloat16(x):   # float32 -> upper 16 bits, rounded to nearest even
+    bits = np.ascontiguousarray(x, dtype=np.float32).view(np.uint32)
+    return ((bits + 0x7FFF + ((bits >> 16) & 1)) >> 16).astype(np.uint16)
+
+def _decode_bfloat16(x):
+    return (x.astype(np.uint32) << 16).view(np.float32)
+
+def _get_bits(bits, idx):
+    return (bits[idx >> 3] >> (7 - (idx & 7))) & 1
+
+def _set_bits(bits, idx, values):
+    masks = (1 << (7 - (idx & 7))).astype(np.uint8)
+    np.bitwise_and.at(bits, idx >> 3, ~masks)    # .at so two slots sharing a byte both get written
+    np.bitwise_or.at(bits, idx >> 3, np.where(values, masks, 0).astype(np.uint8))
+
+
+class CompactReplayBuffer(object):
+    """
+    Replay memory that stores every observation once. Slot i holds s_i, a_i, r_i and done_i, and
+    s'_i is read from slot i+1. When an episode ends, its terminal observation gets a slot of its own
+    that cannot be sampled (valid bit 0), and the next episode starts after it.
+    Actions are uint8, done and valid flags are bit-packed, and observations are kept as
+    obs_dtype: np.float32, np.float16 or 'bfloat16' (upper half of a float32).
+    The 16-bit encodings round on store; sampling decodes exactly what was stored, as `dtype`.
+
+    The successor slot only works for one continuous stream of transitions. With streams=N the
+    capacity is split into N rings, and store_batch takes one transition per stream
+    (e.g. one step of an N-env vector env). store() writes to stream 0.
+    Same sample()/get() contract as common.replay_buffer.ReplayBuffer: len() counts the sampleable
+    transitions, not the frame-only slots, and a minibatch holds n distinct transitions.
+    """
+
+    def __init__(self, capacity, state_dim, obs_dtype=np.float16, dtype=np.float32, streams=1):
+        self.streams = streams
+        self.segment = capacity // streams    # slots per stream
+        if self.segment < 2:
+            raise ValueError('every stream needs at least 2 slots')
+        self.capacity = self.segment * streams
+        self.state_dim = state_dim
+        self.dtype = dtype
+        if obs_dtype == 'bfloat16':
+            self.encode, self.decode = _encode_bfloat16, _decode_bfloat16
+            obs_dtype = np.uint16
+        else:
+            self.encode = lambda x: np.asarray(x, dtype=obs_dtype)
+            self.decode = lambda x: x
+        self.obs = np.zeros((self.capacity, state_dim), dtype=obs_dtype)
+        self.actions = np.zeros(self.capacity, dtype=np.uint8)
+        self.rewards = np.zeros(self.capacity, dtype=np.float32)
+        self.dones = np.zeros((self.capacity + 7) // 8, dtype=np.uint8)
+        self.valid = np.zeros((self.capacity + 7) // 8, dtype=np.uint8)   # slot holds a full transition
+        self.base = np.arange(streams) * self.segment
+        self.pointers = np.zeros(streams, dtype=np.int64)  # next slot to write, per stream
+        self.filled = np.zeros(streams, dtype=np.int64)
+        self.open = np.zeros(streams, dtype=bool)  # last transition of the stream was not done
+        self.transitions = 0    # slots with the valid bit set
+        self.lock = threading.Lock()
+        self.rng = np.random.default_rng()
+
+    @property
+    def size(self):     # slots written, frame-only ones included
+        return int(self.filled.sum())
+
+    def __len__(self):
+        return self.transitions
+
+    @property
+    def nbytes(self):
+        return self.obs.nbytes + self.actions.nbytes + self.rewards.nbytes + self.dones.nbytes + self.valid.nbytes
+
+    def _successor(self, idx):
+        base = idx // self.segment * self.segment
+        return base + (idx - base + 1) % self.segment
+
+    def store(self, state, action, reward, next_state, done):
+        return self.store_batch(np.reshape(state, (1, -1)), [action], [reward],
+                                np.reshape(next_state, (1, -1)), [done])[0]
+
+    def store_batch(self, states, actions, rewards, next_states, dones):
+        n = len(rewards)
+        if n > self.streams:
+            raise ValueError('store_batch got %d transitions for %d streams' % (n, self.streams))
+        dones = np.asarray(dones, dtype=bool)
+        states = self.encode(states)
+        with self.lock:
+            idx = self.base[:n] + self.pointers[:n]
+            # a stream that restarts without a done (e.g. a step limit of the caller) must not
+            # overwrite the s' of its last transition: leave that slot frame-only as well
+            jumped = self.open[:n] & np.any(self.obs[idx] != states, axis=1)
+            if jumped.any():
+                self.pointers[:n] = (self.pointers[:n] + jumped) % self.segment
+                self.filled[:n] = np.minimum(self.filled[:n] + jumped, self.segment)
+                idx = self.base[:n] + self.pointers[:n]
+            succ = self._successor(idx)
+            self.obs[idx] = states
+            self.actions[idx] = actions
+            self.rewards[idx] = rewards
+            _set_bits(self.dones, idx, dones)
+            self.transitions += n - int(_get_bits(self.valid, idx).sum())
+            _set_bits(self.valid, idx, True)
+            self.obs[succ] = self.encode(next_states)   # s' of this slot, overwritten by the same s next step
+            self.transitions -= int(_get_bits(self.valid, succ).sum())
+            _set_bits(self.valid, succ, False)           # the oldest transition there is gone
+
+            advance = 1 + dones   # a done leaves the successor as a frame-only slot
+            self.pointers[:n] = (self.pointers[:n] + advance) % self.segment
+            self.filled[:n] = np.minimum(self.filled[:n] + advance, self.segment)
+            self.open[:n] = ~dones
+        return idx
+
+    def sample_idx(self, n):
+        if n > self.transitions:
+            raise ValueError('cannot sample %d distinct transitions out of %d' % (n, self.transitions))
+        cum = np.cumsum(self.filled)
+        idx = np.empty(0, dtype=np.int64)
+        while idx.size < n:  # uniform draws over the valid slots, redrawing frame-only ones and repeats
+            r = self.rng.integers(0, cum[-1], size=n - idx.size)
+            stream = np.searchsorted(cum, r, side='right')
+            slots = self.base[stream] + r - (cum[stream] - self.filled[stream])
+            idx = np.concatenate([idx, slots[_get_bits(self.valid, slots).astype(bool)]])
+            _, first = np.unique(idx, return_index=True)
+            idx = idx[np.sort(first)]  # keep the first draw of every slot: a sample without replacement
+        return idx
+
+    def get(self, idx):
+        """
+        Returns (states, actions, rewards, next_states, dones) tensors for the given slots.
+        """
+        return (t.from_numpy(self.decode(self.obs[idx]).astype(self.dtype)),
+                t.from_numpy(self.actions[idx].astype(np.int64)),
+                t.from_numpy(self.rewards[idx].astype(self.dtype)),
+                t.from_numpy(self.decode(self.obs[self._successor(idx)]).astype(self.dtype)),
+                t.from_numpy(_get_bits(self.dones, idx).astype(self.dtype)))
+
+    def sample(self, n):
+        return self.get(self.sample_idx(n))
+
+    def state_dict(self):
+        return {'obs': self.obs, 'actions': self.actions, 'rewards': self.rewards, 'dones': self.dones,
+                'valid': self.valid, 'pointers': self.pointers, 'filled': self.filled, 'open': self.open}
+
+    def load_state_dict(self, state):
+        with self.lock:
+            for name in ('obs', 'actions', 'rewards', 'dones', 'valid', 'pointers', 'filled', 'open'):
+                getattr(self, name)[...] = state[name]
+            self.transitions = int(np.unpackbits(self.valid).sum())
@@ -0,0 +1,190 @@
+import json
+import os
+import queue
+import threading
+import numpy as np
+import torch as t
+
+FIELDS = ('states', 'actions', 'rewards', 'next_states', 'dones', 'episodes')
+
+
+def read_meta(directory):
+    with open(os.path.join(directory, 'meta.json')) as f:
+        return json.load(f)
+
+
+class DatasetWriter(object):
+    """
+    Records transitions into a directory of compressed column shards, shard-00000.npz, shard-00001.npz ...:
+    one array per field (states, actions, rewards, next_states, dones, episodes) of about shard_size rows.
+    meta.json lists the shards and is rewritten after each one, so the dataset can be read while it is
+    recorded and a crash loses at most the unwritten shard. An existing dataset is appended to.
+    next_states are stored too: with a vector env consecutive rows belong to different copies,
+    and the last state of an episode is never the state of a later row.
+    """
+
+    def __init__(self, directory, shard_size=100000):
+        self.directory = directory
+        self.shard_size = shard_size
+        os.makedirs(directory, exist_ok=True)
+        if os.path.exists(os.path.join(directory, 'meta.json')):
+            self.meta = read_meta(directory)
+        else:
+            self.meta = {'shards': [], 'episodes': 0}
+        self.rows = {name: [] for name in FIELDS}
+        self.size = 0
+
+    def new_episodes(self, n):
+        """
+        Ids for n episodes that are starting, unique across the whole dataset.
+        """
+        ids = np.arange(self.meta['episodes'], self.meta['episodes'] + n)
+        self.meta['episodes'] += n
+        return ids
+
+    def add(self, states, actions, rewards, next_states, dones, episodes):
+        """
+        One transition per row, e.g. a step of a vector env.
+        """
+        for name, column in zip(FIELDS, (states, actions, rewards, next_states, dones, episodes)):
+            self.rows[name].append(np.asarray(column))
+        self.size += len(rewards)
+        if self.size >= self.shard_size:
+            self.flush()
+
+    def flush(self):
+        if not self.size:
+            return
+        name = 'shard-%05d.npz' % len(self.meta['shards'])
+        tmp = os.path.join(self.directory, name + '.tmp')
+        with open(tmp, 'wb') as f:
+            np.savez_compressed(f, **{k: np.concatenate(rows) for k, rows in self.rows.items()})
+        os.replace(tmp, os.path.join(self.directory, name))
+        self.meta['shards'].append({'file': name, 'size': self.size})
+        tmp = os.path.join(self.directory, 'meta.json.tmp')
+        with open(tmp, 'w') as f:
+            json.dump(self.meta, f)
+        os.replace(tmp, os.path.join(self.directory, 'meta.json'))
+        self.rows = {name: [] for name in FIELDS}
+        self.size = 0
+
+    def close(self):
+        self.flush()
+
+
+class RecordingEnv(object):
+    """
+    Wraps a gym env or a vector env (common.vec_env, common.subproc_vec_env) and records every transition
+    it steps through into a DatasetWriter, whatever agent drives it. Rewards are stored as the env
+    returns them, before any shaping of the training script. Everything else is passed through to env.
+    close() writes the last shard.
+    """
+
+    def __init__(self, env, directory, shard_size=100000):
+        self.env = env
+        self.writer = DatasetWriter(directory, shard_size)
+        self.state = None
+        self.episodes = None
+
+    def __getattr__(self, name):    # spaces, num_envs, render ...
+        return getattr(self.env, name)
+
+    def reset(self):
+        self.state = self.env.reset()
+        self.episodes = self.writer.new_episodes(getattr(self.env, 'num_envs', 1))
+        return self.state
+
+    def step(self, action):
+        next_state, reward, done, info = self.env.step(action)
+        if hasattr(self.env, 'num_envs'):   # finished copies were reset already, their last state is in final_obs
+            self.writer.add(self.state, action, reward, info['final_obs'], done, self.episodes)
+            self.episodes[done] = self.writer.new_episodes(np.count_nonzero(done))
+        else:
+            self.writer.add([self.state], [action], [reward], [next_state], [done], self.episodes)
+        self.state = next_state
+        return next_state, reward, done, info
+
+    def close(self):
+        self.writer.close()
+        self.env.close()
+
+
+class DatasetLoader(object):
+    """
+    Streams shuffled minibatches of a recorded dataset from disk, over and over until close().
+    A background thread reads the shards in a random order, `mix` of them at a time, shuffles their rows
+    together and cuts them into minibatches, which wait in a queue of at most read_ahead batches:
+    memory holds `mix` shards and the queue whatever the size of the dataset.
+    sample(n) returns (states, actions, rewards, next_states, dones) tensors like ReplayBuffer.sample,
+    so the loader can replace a learner's replay buffer or PrefetchSampler; n must be batch_size.
+    Float fields are cast to dtype; collate, if given, is applied to every batch in the worker thread.
+    """
+
+    def __init__(self, directory, batch_size, read_ahead=8, mix=2, dtype=np.float32, collate=None, seed=None):
+        self.directory = directory
+        self.shards = read_meta(directory)['shards']
+        self.batch_size = batch_size
+        self.mix = mix
+        self.dtype = dtype
+        self.collate = collate
+        self.rng = np.random.RandomState(seed)
+        if len(self) < batch_size:
+            raise ValueError('%s holds %d transitions, fewer than a batch' % (directory, len(self)))
+        self.lock = threading.Lock()    # learners sample a replay buffer under its lock
+        self.batches = queue.Queue(maxsize=read_ahead)
+        self.error = None
+        self.running = True
+        self.thread = threading.Thread(target=self._work, daemon=True)
+        self.thread.start()
+
+    def __len__(self):
+        return sum(shard['size'] for shard in self.shards)
+
+    def _load(self, shard):
+        with np.load(os.path.join(self.directory, shard['file'])) as data:
+            return [data['states'].astype(self.dtype), data['actions'], data['rewards'].astype(self.dtype),
+                    data['next_states'].astype(self.dtype), data['dones'].astype(self.dtype)]
+
+    def _batches(self):
+        leftover = []
+        while True:
+            order = self.rng.permutation(len(self.shards))
+            for i in range(0, len(order), self.mix):
+                parts = leftover + [self._load(self.shards[j]) for j in order[i:i + self.mix]]
+                columns = [np.concatenate(column) for column in zip(*parts)]
+                rows = self.rng.permutation(len(columns[2]))
+                end = len(rows) - len(rows) % self.batch_size
+                for start in range(0, end, self.batch_size):
+                    idx = rows[start:start + self.batch_size]
+                    yield tuple(t.from_numpy(column[idx]) for column in columns)
+                leftover = [[column[rows[end:]] for column in columns]]   # rows short of a batch join the next shards
+
+    def _work(self):
+        try:
+            for batch in self._batches():
+                if self.collate is not None:
+                    batch = self.collate(batch)
+                while self.running:
+                    try:
+                        self.batches.put(batch, timeout=0.1)
+                        break
+                    except queue.Full:
+                        pass
+                if not self.running:
+                    return
+        except Exception as e:
+            self.error = e
+
+    def sample(self, n):
+        if n != self.batch_size:
+            raise ValueError('the loader cuts batches of %d transitions, not %d' % (self.batch_size, n))
+        while True:
+            try:
+                return self.batches.get(timeout=0.1)
+            except queue.Empty:
+                if self.error is not None:
+                    raise self.error
+
+    def close(self):
+        self.running = False
+        self.thread.join()
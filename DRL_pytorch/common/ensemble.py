@@ -0,0 +1,135 @@
+import numpy as np
+import torch as t
+from torch import nn
+
+
+def _per_member(value, k, dtype):
+    # a scalar or one value per member -> [K] tensor
+    return t.as_tensor(np.broadcast_to(np.asarray(value, dtype=np.float64), (k,)).copy(), dtype=dtype)
+
+
+class EnsembleMLP(nn.Module):
+    """
+    K independent MLPs of the same architecture as one module. Layer l keeps the weights of all members
+    in one [K, in, out] parameter, so a forward pass is one baddbmm per layer for the whole ensemble:
+    x [K, B, in] -> [K, B, out]. relu follows every layer but the last, output_fn (e.g. softmax for a
+    Policy_net) may transform the output. Member k only ever sees its own slice of x and of the weights,
+    so its gradients are exactly those of a separate net.
+    Every member is initialized like its own nn.Linear layers; from_linears stacks existing nets instead.
+    """
+
+    def __init__(self, k, sizes, output_fn=None):
+        nn.Module.__init__(self)
+        self.k = k
+        self.output_fn = output_fn
+        self.weights = nn.ParameterList()
+        self.biases = nn.ParameterList()
+        for n_in, n_out in zip(sizes[:-1], sizes[1:]):
+            linears = [nn.Linear(n_in, n_out) for _ in range(k)]
+            self.weights.append(nn.Parameter(t.stack([l.weight.detach().t() for l in linears])))
+            self.biases.append(nn.Parameter(t.stack([l.bias.detach() for l in linears]).unsqueeze(1)))
+
+    @classmethod
+    def from_linears(cls, members, output_fn=None):
+        """
+        members: one list of nn.Linear layers, in forward order, per member.
+        """
+        sizes = [members[0][0].in_features] + [l.out_features for l in members[0]]
+        ensemble = cls(len(members), sizes, output_fn)
+        with t.no_grad():
+            for w, b, layers in zip(ensemble.weights, ensemble.biases, zip(*members)):
+                w.copy_(t.stack([l.weight.t() for l in layers]))
+                b.copy_(t.stack([l.bias for l in layers]).unsqueeze(1))
+        return ensemble
+
+    def copy_member_to(self, k, linears):
+        """
+        Copies member k into the nn.Linear layers of a regular net, e.g. to save it as a Q_net.
+        """
+        with t.no_grad():
+            for w, b, l in zip(self.weights, self.biases, linears):
+                l.weight.copy_(w[k].t())
+                l.bias.copy_(b[k, 0])
+
+    def forward(self, x):
+        last = len(self.weights) - 1
+        for i, (w, b) in enumerate(zip(self.weights, self.biases)):
+            x = t.baddbmm(b, x, w)
+            if i < last:
+                x = t.relu(x)
+        if self.output_fn is not None:
+            x = self.output_fn(x)
+        return x
+
+
+class EnsembleSGD(t.optim.Optimizer):
+    """
+    SGD with momentum for parameters with a leading member axis (EnsembleMLP), whose lr and momentum
+    are a scalar or one value per member, so a hyperparameter sweep trains as one ensemble.
+    """
+
+    def __init__(self, params, lr, momentum=0.):
+        params = list(params)
+        k, dtype = params[0].shape[0], params[0].dtype
+        t.optim.Optimizer.__init__(self, params, dict(lr=_per_member(lr, k, dtype),
+                                                      momentum=_per_member(momentum, k, dtype)))
+
+    @t.no_grad()
+    def step(self, closure=None):
+        for group in self.param_groups:
+            for p in group['params']:
+                if p.grad is None:
+                    continue
+                shape = (-1,) + (1,) * (p.dim() - 1)    # broadcast the [K] hyperparameters over the member's slice
+                d_p = p.grad
+                if group['momentum'].any():
+                    state = self.state[p]
+                    if 'momentum_buffer' not in state:
+                        state['momentum_buffer'] = d_p.clone()
+                    else:
+                        state['momentum_buffer'].mul_(group['momentum'].view(shape)).add_(d_p)
+                    d_p = state['momentum_buffer']
+                p.sub_(group['lr'].view(shape) * d_p)
+
+
+class EnsembleReplayBuffer(object):
+    """
+    One replay ring per member, stored as [K, capacity, ...] arrays. store_batch takes one transition
+    per member, e.g. a step of a K-env vector env where env k belongs to member k. sample(n) draws
+    n distinct slots for every member from its own random stream (seeded with seeds[k]) and returns
+    (states, actions, rewards, next_states, dones) tensors shaped [K, n, ...].
+    """
+
+    def __init__(self, k, capacity, state_dim, seeds=None, dtype=np.float32):
+        self.k = k
+        self.capacity = capacity
+        self.states = np.zeros((k, capacity, state_dim), dtype=dtype)
+        self.actions = np.zeros((k, capacity), dtype=np.int64)
+        self.rewards = np.zeros((k, capacity), dtype=dtype)
+        self.next_states = np.zeros((k, capacity, state_dim), dtype=dtype)
+        self.dones = np.zeros((k, capacity), dtype=dtype)
+        self.rngs = [np.random.default_rng(seed) for seed in (seeds if seeds is not None else [None] * k)]
+        self.rows = np.arange(k)[:, None]
+        self.data_pointer = 0   # the members step in lockstep and share the write position
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def store_batch(self, states, actions, rewards, next_states, dones):
+        idx = self.data_pointer
+        self.states[:, idx] = states
+        self.actions[:, idx] = actions
+        self.rewards[:, idx] = rewards
+        self.next_states[:, idx] = next_states
+        self.dones[:, idx] = dones
+        self.data_pointer = (idx + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+
+    def sample(self, n):
+        idx = np.stack([rng.choice(self.size, n, replace=False) for rng in self.rngs])   # [K, n], like ReplayBuffer
+        return (t.from_numpy(self.states[self.rows, idx]),
+                t.from_numpy(self.actions[self.rows, idx]),
+                t.from_numpy(self.rewards[self.rows, idx]),
+                t.from_numpy(self.next_states[self.rows, idx]),
+                t.from_numpy(self.dones[self.rows, idx]))
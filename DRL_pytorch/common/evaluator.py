@@ -0,0 +1,83 @@
+import multiprocessing as mp
+import queue
+import torch as t
+
+
+def _as_input(net, state):
+    dtype = next(net.parameters()).dtype
+    return t.as_tensor(state, dtype=dtype).view(1, -1)
+
+def greedy_action(net, state):   # argmax of a Q network
+    return net(_as_input(net, state)).argmax().item()
+
+def sample_action(net, state):   # sample from a softmax policy network
+    action_probabilities = net(_as_input(net, state))
+    return t.distributions.Categorical(action_probabilities).sample().item()
+
+def deterministic_action(net, state):   # output of a deterministic policy network, e.g. the DDPG actor
+    return net(_as_input(net, state)).view(-1).numpy()
+
+def _worker(env_fn, net, action_fn, episodes, render, jobs, results):
+    env = env_fn()
+    while True:
+        job = jobs.get()
+        if job is None:
+            break
+        tag, state_dict = job
+        net.load_state_dict({k: t.from_numpy(v) for k, v in state_dict.items()})
+        total_reward = 0
+        with t.no_grad():
+            for i in range(episodes):
+                state = env.reset()
+                while True:
+                    if render:
+                        env.render()
+                    action = action_fn(net, state)
+                    state, reward, done, _ = env.step(action)
+                    total_reward += reward
+                    if done:
+                        break
+        results.put((tag, total_reward / episodes))
+    env.close()
+
+
+class AsyncEvaluator(object):
+    """
+    Runs the periodic test episodes in a separate process, so the learner never waits on them.
+    submit(tag, net) snapshots net's parameters as numpy arrays and queues them; the worker loads them
+    into its own copy of net, plays `episodes` episodes with action_fn and sends back the average reward.
+    poll() returns the (tag, average reward) pairs finished so far without blocking.
+    """
+
+    def __init__(self, env_fn, net, action_fn=greedy_action, episodes=10, render=False):
+        self.jobs = mp.Queue()
+        self.results = mp.Queue()
+        self.process = mp.Process(target=_worker, args=(env_fn, net, action_fn, episodes, render, self.jobs, self.results),
+                                  daemon=True)
+        self.process.start()
+
+    def submit(self, tag, net):
+        state_dict = {k: v.detach().cpu().numpy().copy() for k, v in net.state_dict().items()}
+        self.jobs.put((tag, state_dict))
+
+    def poll(self):
+        results = []
+        while True:
+            try:
+                results.append(self.results.get_nowait())
+            except queue.Empty:
+                return results
+
+    def close(self):
+        """
+        Lets the worker finish the evaluations already submitted and returns their results.
+        """
+        self.jobs.put(None)
+        results = []
+        while self.process.is_alive() or not self.results.empty():
+            try:
+                results.append(self.results.get(timeout=0.1))
+            except queue.Empty:
+                pass
+        self.process.join()
+        return results
@@ -0,0 +1,115 @@
+import multiprocessing as mp
+import queue
+import threading
+import time
+import numpy as np
+import torch as t
+
+
+def sample_actions(action_probabilities):   # softmax policy output [N, action_dim]
+    return t.distributions.Categorical(action_probabilities).sample().numpy()
+
+def greedy_actions(q_values):   # Q network output [N, action_dim]
+    return q_values.argmax(1).numpy()
+
+
+class _SharedArray(object):
+    def __init__(self, raw, shape, dtype):
+        self.spec = (raw, shape, dtype)
+        self.array = np.frombuffer(raw, dtype=dtype).reshape(shape)
+
+    @classmethod
+    def zeros(cls, shape, dtype):
+        dtype = np.dtype(dtype)
+        return cls(mp.RawArray('b', int(np.prod(shape)) * dtype.itemsize), shape, dtype)
+
+    def __getstate__(self):  # the numpy view is rebuilt on the shared buffer in the child process
+        return self.spec
+
+    def __setstate__(self, spec):
+        self.__init__(*spec)
+
+
+class InferenceClient(object):
+    """
+    Handle of one actor. act(state) writes the state into its row of the shared state array,
+    queues its id and waits until the server has written the action back.
+    Safe to hand to a worker process at creation time or to a thread.
+    """
+
+    def __init__(self, client_id, states, actions, requests, event):
+        self.client_id = client_id
+        self.states = states
+        self.actions = actions
+        self.requests = requests
+        self.event = event
+
+    def act(self, state):
+        self.event.clear()
+        self.states.array[self.client_id] = state
+        self.requests.put(self.client_id)
+        self.event.wait()
+        return self.actions.array[self.client_id]
+
+
+class InferenceServer(object):
+    """
+    Batches the action requests of many actors into one forward pass of net.
+    A background thread waits for a first request, keeps collecting until max_batch_size requests
+    are pending or max_wait seconds have passed, runs net once on all the gathered states and
+    maps the output to actions with action_fn. States and actions travel through shared arrays,
+    only client ids go through the queue.
+    """
+
+    def __init__(self, net, num_clients, state_dim, action_fn=sample_actions, max_batch_size=32, max_wait=0.001):
+        self.net = net
+        self.action_fn = action_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        dtype = t.empty(0, dtype=next(net.parameters()).dtype).numpy().dtype
+        self.states = _SharedArray.zeros((num_clients, state_dim), dtype)
+        self.actions = _SharedArray.zeros((num_clients,), np.int64)
+        self.requests = mp.Queue()
+        self.events = [mp.Event() for _ in range(num_clients)]
+        self.running = False
+        self.thread = None
+
+    def client(self, client_id):
+        return InferenceClient(client_id, self.states, self.actions, self.requests, self.events[client_id])
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self._serve, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join()
+
+    def _collect(self):
+        try:
+            ids = [self.requests.get(timeout=0.1)]
+        except queue.Empty:
+            return None
+        deadline = time.time() + self.max_wait
+        while len(ids) < self.max_batch_size:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            try:
+                ids.append(self.requests.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return np.array(ids)
+
+    def _serve(self):
+        while self.running:
+            ids = self._collect()
+            if ids is None:
+                continue
+            with t.no_grad():
+                output = self.net(t.from_numpy(self.states.array[ids]))
+            self.actions.array[ids] = self.action_fn(output)
+            for client_id in ids:
+                self.events[client_id].set()
@@ -0,0 +1,59 @@
+import threading
+
+
+class LearnerThread(object):
+    """
+    Runs learn_fn() over and over in a background thread while the caller keeps stepping the env.
+    The caller reports its env steps with add_steps(n). The learner waits until ready_fn() is true
+    (e.g. the replay holds a batch), then keeps updates <= replay_ratio * env steps;
+    replay_ratio=None lets it update as fast as it can.
+    Torch releases the GIL inside its kernels, so the learner's forward/backward passes overlap with acting.
+    learn_fn must do its own locking against the acting thread (replay lock, nets).
+    The result of the last learn_fn() is kept in `loss`. If learn_fn raises, add_steps() and close()
+    re-raise the error in the caller's thread.
+    """
+
+    def __init__(self, learn_fn, ready_fn, replay_ratio=1.):
+        self.learn_fn = learn_fn
+        self.ready_fn = ready_fn
+        self.replay_ratio = replay_ratio
+        self.env_steps = 0
+        self.updates = 0
+        self.loss = 0.
+        self.error = None
+        self.stopped = False
+        self.cond = threading.Condition()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _can_update(self):
+        if self.replay_ratio is not None and self.updates >= self.replay_ratio * self.env_steps:
+            return False
+        return self.ready_fn()
+
+    def _run(self):
+        try:
+            while True:
+                with self.cond:
+                    self.cond.wait_for(lambda: self.stopped or self._can_update())
+                    if self.stopped:
+                        return
+                self.loss = self.learn_fn()
+                self.updates += 1
+        except Exception as e:
+            self.error = e
+
+    def add_steps(self, n=1):
+        if self.error is not None:
+            raise self.error
+        with self.cond:
+            self.env_steps += n
+            self.cond.notify()
+
+    def close(self):
+        with self.cond:
+            self.stopped = True
+            self.cond.notify()
+        self.thread.join()
+        if self.error is not None:
+            raise self.error
@@ -0,0 +1,74 @@
+import json
+import time
+from collections import defaultdict
+
+
+class MetricsWriter(object):
+    """
+    Appends training metrics to a JSON-lines file, one {"event": ..., "time": ..., **fields} object per line:
+        metrics.log('episode', episode=3, steps=200, loss=0.1, epsilon=0.4)
+        metrics.log('eval', episode=29, reward=200.)
+    Lines are kept in memory and appended to the file every flush_every seconds and on close(),
+    so logging costs a json.dumps per record and nothing is held beyond one flush window.
+    A 'start' record (log_start) marks where a run begins or resumes from a checkpoint: read_metrics()
+    drops the records of episodes at or after that point written by earlier runs.
+    Plot the file with tools/plot_metrics.py.
+    """
+
+    def __init__(self, path, flush_every=5.):
+        self.path = path
+        self.flush_every = flush_every
+        self.lines = []
+        self.last_flush = time.time()
+        self.file = open(path, 'a')
+
+    def log(self, event, **fields):
+        record = {'event': event, 'time': round(time.time(), 3)}
+        record.update(fields)
+        self.lines.append(json.dumps(record))
+        if record['time'] - self.last_flush >= self.flush_every:
+            self.flush()
+
+    def log_start(self, episode=0):
+        self.log('start', episode=episode)
+
+    def flush(self):
+        if self.lines:
+            self.file.write('\n'.join(self.lines) + '\n')
+            self.file.flush()
+            self.lines = []
+        self.last_flush = time.time()
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+
+def read_metrics(path):
+    """
+    Records of the last run in the file, including the episodes it resumed from.
+    A line cut short by a crash mid-write is skipped.
+    """
+    records = []
+    with open(path) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if record['event'] == 'start':
+                records = [r for r in records if r.get('episode', -1) < record['episode']]
+            records.append(record)
+    return records
+
+def columns(records, event):
+    """
+    {field: [values]} of the records of one event; fields a record lacks are None.
+    """
+    records = [r for r in records if r['event'] == event]
+    fields = sorted(set(k for r in records for k in r) - {'event'})
+    table = defaultdict(list)
+    for r in records:
+        for k in fields:
+            table[k].append(r.get(k))
+    return dict(table)
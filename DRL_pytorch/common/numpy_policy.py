@@ -0,0 +1,50 @@
+import numpy as np
+
+
+class NumpyMLP(object):
+    """
+    NumPy copy of a small torch MLP, for acting one step at a time without torch overhead.
+    linears are the nn.Linear layers in forward order; relu follows every layer but the last,
+    output_fn(out) may then transform the last layer's output in place (e.g. tanh).
+    Call refresh() after the torch net changes. It copies the weights into new arrays and then swaps
+    the reference in one assignment, so a forward running on another thread (e.g. acting while a learner
+    thread refreshes) uses either the old or the new weights, never a half-written mix.
+    The forward writes into buffers kept per batch size, the returned array is only valid until the next call.
+    """
+
+    def __init__(self, linears, output_fn=None):
+        self.linears = list(linears)
+        self.output_fn = output_fn
+        self.refresh()
+        self.dtype = self.params[0][0].dtype
+        self.buffers = {}
+
+    def refresh(self):
+        weights = [l.weight.detach().cpu().numpy().T.copy() for l in self.linears]   # [in, out] so x @ w
+        biases = [l.bias.detach().cpu().numpy().copy() for l in self.linears]
+        self.params = (weights, biases)
+
+    def _buffers(self, n):
+        if n not in self.buffers:
+            self.buffers[n] = [np.empty((n, w.shape[1]), dtype=self.dtype) for w in self.params[0]]
+        return self.buffers[n]
+
+    def __call__(self, x):
+        """
+        x: [in] or [N, in]; returns [out] or [N, out].
+        """
+        x = np.asarray(x, dtype=self.dtype)
+        single = x.ndim == 1
+        h = x.reshape(1, -1) if single else x
+        weights, biases = self.params     # one read: a concurrent refresh() does not change them under us
+        buffers = self._buffers(len(h))
+        last = len(weights) - 1
+        for i, (w, b, out) in enumerate(zip(weights, biases, buffers)):
+            np.dot(h, w, out=out)
+            out += b
+            if i < last:
+                np.maximum(out, 0, out=out)
+            h = out
+        if self.output_fn is not None:
+            self.output_fn(h)
+        return h[0] if single else h
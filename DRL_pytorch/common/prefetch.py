@@ -0,0 +1,75 @@
+import queue
+import threading
+
+
+class PrefetchSampler(object):
+    """
+    Samples minibatches from a ReplayBuffer in a background thread and keeps up to queue_size of them ready,
+    so sampling and collation overlap with the learner's forward and backward passes.
+    sample(n) has the same contract as ReplayBuffer.sample and can replace it in a learner.
+    collate, if given, is applied to every batch in the worker thread (reshapes, dtype casts ...).
+    Batches are drawn while the learner is still busy with earlier ones, so they can miss
+    the last few transitions stored: at most queue_size batches old.
+    The worker waits on `filled` until the buffer holds min_size transitions: the caller notifies it
+    after storing (filled.set() costs nothing once it is set). If sampling or collate raises,
+    sample() re-raises the error in the learner's thread.
+    """
+
+    def __init__(self, buffer, batch_size, queue_size=4, collate=None, min_size=None):
+        self.buffer = buffer
+        self.batch_size = batch_size
+        self.collate = collate
+        self.min_size = batch_size if min_size is None else min_size   # wait until the buffer holds this many
+        self.batches = queue.Queue(maxsize=queue_size)
+        self.filled = threading.Event()
+        self.error = None
+        self.running = True
+        self.thread = threading.Thread(target=self._work, daemon=True)
+        self.thread.start()
+
+    def _draw(self, n):
+        with self.buffer.lock:  # the actor may be writing the same arrays
+            batch = self.buffer.sample(n)
+        if self.collate is not None:
+            batch = self.collate(batch)
+        return batch
+
+    def stored(self):
+        """
+        Tells the worker the buffer has grown, call it after storing transitions.
+        """
+        if not self.filled.is_set() and len(self.buffer) >= self.min_size:
+            self.filled.set()
+
+    def _work(self):
+        try:
+            while self.running:
+                if not self.filled.wait(timeout=0.1):
+                    self.stored()   # the buffer may have been filled without a notice (e.g. restored from a checkpoint)
+                    continue
+                if not self.running:
+                    break
+                batch = self._draw(self.batch_size)
+                while self.running:
+                    try:
+                        self.batches.put(batch, timeout=0.1)
+                        break
+                    except queue.Full:
+                        pass
+        except Exception as e:
+            self.error = e
+
+    def sample(self, n):
+        if n != self.batch_size:    # off-size requests bypass the queue
+            return self._draw(n)
+        while True:
+            try:
+                return self.batches.get(timeout=0.1)
+            except queue.Empty:
+                if self.error is not None:
+                    raise self.error
+
+    def close(self):
+        self.running = False
+        self.filled.set()
+        self.thread.join()
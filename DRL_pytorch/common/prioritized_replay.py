@@ -0,0 +1,234 @@
+import threading
+import numpy as np
+
+from common.replay_buffer import ReplayBuffer
+
+
+class SumTree(object):
+    """
+    This SumTree code is a modified version and the original code is from:
+    https://github.com/jaara/AI-blog/blob/master/SumTree.py
+    Story priorities of the transitions in the tree, the transitions themselves live in a ReplayBuffer
+    whose slot i corresponds to leaf i + capacity - 1.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity  # for all priority values
+        self.tree = np.zeros(2 * capacity - 1)
+        # [--------------Parent nodes-------------][-------leaves to recode priority-------]
+        #             size: capacity - 1                       size: capacity
+        self.depth = (2 * capacity - 1).bit_length() - 1  # depth of the deepest leaf
+
+    def update(self, tree_idx, p):
+        change = p - self.tree[tree_idx]
+        self.tree[tree_idx] = p
+        # then propagate the change through tree
+        while tree_idx != 0:    # this method is faster than the recursive loop in the reference code
+            tree_idx = (tree_idx - 1) // 2
+            self.tree[tree_idx] += change
+
+    def batch_update(self, tree_idx, ps):
+        """
+        Set many leaves at once, then recompute their ancestors one level per pass.
+        Leaves may sit at different depths when capacity is not a power of 2; a node is
+        recomputed again on every later pass that reaches it, so its last value is correct.
+        """
+        tree_idx = np.asarray(tree_idx)
+        self.tree[tree_idx] = ps
+        parent_idx = np.unique((tree_idx[tree_idx > 0] - 1) // 2)
+        while parent_idx.size:
+            self.tree[parent_idx] = self.tree[2 * parent_idx + 1] + self.tree[2 * parent_idx + 2]
+            parent_idx = np.unique((parent_idx[parent_idx > 0] - 1) // 2)
+
+    def get_leaf(self, v):
+        """
+        Tree structure and array storage:
+        Tree index:
+             0         -> storing priority sum
+            / \
+          1     2
+         / \   / \
+        3   4 5   6    -> storing priority for transitions
+        Array type for storing:
+        [0,1,2,3,4,5,6]
+        """
+        parent_idx = 0
+        while True:     # the while loop is faster than the method in the reference code
+            cl_idx = 2 * parent_idx + 1         # this leaf's left and right kids
+            cr_idx = cl_idx + 1
+            if cl_idx >= len(self.tree):        # reach bottom, end search
+                leaf_idx = parent_idx
+                break
+            else:       # downward search, always search for a higher priority node
+                if v <= self.tree[cl_idx]:
+                    parent_idx = cl_idx
+                else:
+                    v -= self.tree[cl_idx]
+                    parent_idx = cr_idx
+
+        return leaf_idx, self.tree[leaf_idx]
+
+    def get_leaves(self, values):
+        """
+        Same search as get_leaf, but all values descend together one level per step.
+        Nodes that already reached a leaf keep their index for the remaining steps.
+        """
+        values = np.array(values, dtype=np.float64)
+        leaf_idx = np.zeros(len(values), dtype=np.int64)
+        for _ in range(self.depth):
+            is_parent = leaf_idx < self.capacity - 1
+            cl_idx = 2 * leaf_idx + 1
+            left_p = self.tree[np.where(is_parent, cl_idx, 0)]
+            go_right = is_parent & (values > left_p)
+            values -= np.where(go_right, left_p, 0.)
+            leaf_idx = np.where(is_parent, cl_idx + go_right, leaf_idx)
+        return leaf_idx, self.tree[leaf_idx]
+
+    @property
+    def total_p(self):
+        return self.tree[0]  # the root
+
+class SegmentTree(object):
+    """
+    Same array layout as SumTree, but every parent keeps op(left kid, right kid) instead of the sum,
+    so the extremum over all priorities is read from the root in O(1) and kept up to date in O(log N).
+    Empty leaves hold the neutral element of op and never win.
+    """
+    op = None
+    neutral = None
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.tree = np.full(2 * capacity - 1, self.neutral)
+
+    def update(self, tree_idx, p):
+        self.tree[tree_idx] = p
+        while tree_idx != 0:
+            tree_idx = (tree_idx - 1) // 2
+            self.tree[tree_idx] = self.op(self.tree[2 * tree_idx + 1], self.tree[2 * tree_idx + 2])
+
+    def batch_update(self, tree_idx, ps):   # see SumTree.batch_update
+        tree_idx = np.asarray(tree_idx)
+        self.tree[tree_idx] = ps
+        parent_idx = np.unique((tree_idx[tree_idx > 0] - 1) // 2)
+        while parent_idx.size:
+            self.tree[parent_idx] = self.op(self.tree[2 * parent_idx + 1], self.tree[2 * parent_idx + 2])
+            parent_idx = np.unique((parent_idx[parent_idx > 0] - 1) // 2)
+
+    @property
+    def value(self):
+        return self.tree[0]  # the root
+
+class MinTree(SegmentTree):
+    op = np.minimum
+    neutral = np.inf
+
+class MaxTree(SegmentTree):
+    op = np.maximum
+    neutral = -np.inf
+
+class Memory(object):  # stored as ( s, a, r, s_ ) in a ReplayBuffer, priorities in a SumTree
+    """
+    This Memory class is modified based on the original code from:
+    https://github.com/jaara/AI-blog/blob/master/Seaquest-DDQN-PER.py
+    store()/store_batch()/add()/batch_update() hold `lock`, a learner on another thread takes it while sampling.
+    """
+    epsilon = 0.01  # small amount to avoid zero priority
+    alpha = 0.6  # [0~1] convert the importance of TD error to priority
+    beta = 0.4  # importance-sampling, from initial value increasing to 1
+    beta_increment_per_sampling = 0.001
+    abs_err_upper = 1.  # clipped abs error
+
+    def __init__(self, capacity, state_dim, storage=None):
+        self.tree = SumTree(capacity)
+        self.min_tree = MinTree(capacity)   # smallest priority, normalizer of the ISweights
+        self.max_tree = MaxTree(capacity)   # largest priority, given to new transitions
+        self.storage = storage if storage is not None else ReplayBuffer(capacity, state_dim)
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.storage)
+
+    def store(self, state, action, reward, next_state, done):
+        with self.lock:
+            data_idx = self.storage.store(state, action, reward, next_state, done)
+            self._add(data_idx)
+
+    def add(self, data_idx):
+        """
+        Gives the current max priority to slots someone else wrote into `storage`,
+        e.g. a replay store shared by several learners (tools/compare_learners.py).
+        """
+        with self.lock:
+            self._add(np.atleast_1d(data_idx))
+
+    def _add(self, data_idx):
+        max_p = self.max_tree.value
+        if max_p <= 0:  # empty memory
+            max_p = self.abs_err_upper
+        tree_idx = data_idx + self.tree.capacity - 1
+        if np.ndim(tree_idx) > 0:
+            ps = np.full(len(tree_idx), max_p)
+            self.tree.batch_update(tree_idx, ps)
+            self.min_tree.batch_update(tree_idx, ps)
+            self.max_tree.batch_update(tree_idx, ps)
+        else:
+            self.tree.update(tree_idx, max_p)   # set the max p for new p
+            self.min_tree.update(tree_idx, max_p)
+            self.max_tree.update(tree_idx, max_p)
+
+    def store_batch(self, states, actions, rewards, next_states, dones, abs_errors=None):
+        """
+        Store a block of transitions with one write per field and one pass over each tree.
+        abs_errors (e.g. TD errors computed by an Ape-X actor) set their initial priorities,
+        without them every transition gets the current max priority like in store().
+        """
+        with self.lock:
+            data_idx = self.storage.store_batch(states, actions, rewards, next_states, dones)
+            if abs_errors is None:
+                self._add(data_idx)
+                return
+            ps = self._priorities(np.asarray(abs_errors))
+            tree_idx = data_idx + self.tree.capacity - 1
+            self.tree.batch_update(tree_idx, ps)
+            self.min_tree.batch_update(tree_idx, ps)
+            self.max_tree.batch_update(tree_idx, ps)
+
+    def sample(self, n):
+        pri_seg = self.tree.total_p / n       # priority segment
+        self.beta = np.min([1., self.beta + self.beta_increment_per_sampling])  # max = 1
+
+        min_prob = self.min_tree.value / self.tree.total_p     # for later calculate ISweight
+        if min_prob == 0:
+            min_prob = 0.00001
+        segments = np.arange(n)
+        v = np.random.uniform(pri_seg * segments, pri_seg * (segments + 1))   # one value in each segment
+        b_idx, p = self.tree.get_leaves(v)
+        prob = p / self.tree.total_p
+        ISWeights = np.power(prob/min_prob, -self.beta).astype(np.float32)
+        b_memory = self.storage.get(b_idx - self.tree.capacity + 1)
+        return b_idx, b_memory, ISWeights
+
+    def _priorities(self, abs_errors):
+        abs_errors = abs_errors + self.epsilon  # avoid 0
+        clipped_errors = np.minimum(abs_errors, self.abs_err_upper)
+        return np.power(clipped_errors, self.alpha)
+
+    def batch_update(self, tree_idx, abs_errors):
+        ps = self._priorities(abs_errors.detach().numpy())
+        with self.lock:
+            self.tree.batch_update(tree_idx, ps)
+            self.min_tree.batch_update(tree_idx, ps)
+            self.max_tree.batch_update(tree_idx, ps)
+
+    def state_dict(self):
+        return {'tree': self.tree.tree, 'min_tree': self.min_tree.tree, 'max_tree': self.max_tree.tree,
+                'beta': float(self.beta), 'storage': self.storage.state_dict()}
+
+    def load_state_dict(self, state):
+        with self.lock:
+            self.tree.tree[...] = state['tree']
+            self.min_tree.tree[...] = state['min_tree']
+            self.max_tree.tree[...] = state['max_tree']
+            self.beta = state['beta']
+            self.storage.load_state_dict(state['storage'])
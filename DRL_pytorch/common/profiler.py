@@ -0,0 +1,113 @@
+import time
+from collections import defaultdict
+
+
+class _NullTimer(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NULL_TIMER = _NullTimer()
+
+
+class _Timer(object):
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler.totals[self.name] += time.perf_counter() - self.start
+        self.profiler.calls[self.name] += 1
+        return False
+
+
+class _Update(_Timer):
+    # times one learner update and starts/stops the torch.profiler trace around the selected ones
+    def __enter__(self):
+        p = self.profiler
+        if p.trace_updates is not None and p.updates == p.trace_updates[0]:
+            import torch.profiler
+            p.trace = torch.profiler.profile(activities=[torch.profiler.ProfilerActivity.CPU], record_shapes=True)
+            p.trace.__enter__()
+        return _Timer.__enter__(self)
+
+    def __exit__(self, *exc):
+        _Timer.__exit__(self, *exc)
+        p = self.profiler
+        p.updates += 1
+        p.counters['update'] += 1
+        if p.trace is not None and p.updates == p.trace_updates[0] + p.trace_updates[1]:
+            p.trace.__exit__(None, None, None)
+            p.trace.export_chrome_trace(p.trace_path)
+            print('torch.profiler trace of updates %d-%d written to %s' % (p.trace_updates[0], p.updates - 1, p.trace_path))
+            p.trace = None
+        return False
+
+
+class Profiler(object):
+    """
+    Wall-clock timers and counters for the phases of a training loop.
+        with profiler.timer('sample'): ...      # accumulate time under a name
+        profiler.count('env_step', n)           # count events
+        with profiler.update(): ...             # one learner update, counted as 'update'
+    maybe_report() prints, every report_every seconds, env steps/sec, updates/sec and the share of
+    wall time spent in every timer since the last report, then starts a new window.
+    Timers may nest, so shares can add up to more than 100%.
+    trace_updates=(first, n) records updates first..first+n-1 with torch.profiler to trace_path (chrome trace),
+    whether or not the profiler is enabled: update() counts updates until the trace is written.
+    A disabled profiler costs one attribute check per timer.
+    """
+
+    def __init__(self, enabled=True, report_every=10., trace_updates=None, trace_path='trace.json', name=''):
+        self.enabled = enabled
+        self.report_every = report_every
+        self.trace_updates = trace_updates
+        self.trace_path = trace_path
+        self.name = name
+        self.trace = None
+        self.updates = 0
+        self.reset()
+
+    def reset(self):
+        self.totals = defaultdict(float)
+        self.calls = defaultdict(int)
+        self.counters = defaultdict(int)
+        self.window_start = time.perf_counter()
+
+    def timer(self, name):
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Timer(self, name)
+
+    def update(self):
+        if not self.enabled and not self._tracing():
+            return _NULL_TIMER
+        return _Update(self, 'update')
+
+    def _tracing(self):    # a trace was asked for and is not written yet
+        return self.trace_updates is not None and self.updates < self.trace_updates[0] + self.trace_updates[1]
+
+    def count(self, name, n=1):
+        if self.enabled:
+            self.counters[name] += n
+
+    def report(self):
+        elapsed = max(time.perf_counter() - self.window_start, 1e-9)
+        parts = ['%s%.1fs' % (self.name + ' ' if self.name else '', elapsed),
+                 'env steps/s %.0f' % (self.counters['env_step'] / elapsed),
+                 'updates/s %.1f' % (self.counters['update'] / elapsed)]
+        for name in sorted(self.totals, key=self.totals.get, reverse=True):
+            parts.append('%s %.1f%% (%.3fms)' % (name, 100 * self.totals[name] / elapsed,
+                                                 1000 * self.totals[name] / self.calls[name]))
+        return ' | '.join(parts)
+
+    def maybe_report(self):
+        if self.enabled and time.perf_counter() - self.window_start >= self.report_every:
+            print(self.report())
+            self.reset()
@@ -0,0 +1,179 @@
+import json
+import os
+import threading
+import numpy as np
+import torch as t
+
+
+class ReplayBuffer(object):
+    """
+    Experience replay stored as preallocated contiguous numpy arrays.
+    The buffer is a ring: once capacity is reached the oldest slot is overwritten.
+    sample() gathers every field with a single fancy index and wraps the result
+    with torch.from_numpy, so a minibatch costs no python-level collation.
+    A minibatch holds n distinct transitions (sampled without replacement).
+    store()/store_batch() hold `lock`, readers on other threads (see common.prefetch) take it while sampling.
+    """
+
+    def __init__(self, capacity, state_dim, action_shape=(), action_dtype=np.int64, dtype=np.float32):
+        self.capacity = capacity
+        self.state_dim = state_dim
+        self.states = self._allocate('states', (capacity, state_dim), dtype)
+        self.actions = self._allocate('actions', (capacity,) + tuple(action_shape), action_dtype)
+        self.rewards = self._allocate('rewards', (capacity,), dtype)
+        self.next_states = self._allocate('next_states', (capacity, state_dim), dtype)
+        self.dones = self._allocate('dones', (capacity,), dtype)
+        self.data_pointer = 0   # next slot to write
+        self.size = 0
+        self.lock = threading.Lock()
+        self.rng = np.random.default_rng()
+
+    def _allocate(self, name, shape, dtype):
+        return np.zeros(shape, dtype=dtype)
+
+    def __len__(self):
+        return self.size
+
+    def store(self, state, action, reward, next_state, done):
+        with self.lock:
+            idx = self.data_pointer
+            self.states[idx] = state
+            self.actions[idx] = action
+            self.rewards[idx] = reward
+            self.next_states[idx] = next_state
+            self.dones[idx] = done
+
+            self.data_pointer += 1
+            if self.data_pointer >= self.capacity:  # replace when exceed the capacity
+                self.data_pointer = 0
+            self.size = min(self.size + 1, self.capacity)
+        return idx
+
+    def store_batch(self, states, actions, rewards, next_states, dones):
+        """
+        Store one transition per row, e.g. a step of a vector env, with a single write per field.
+        """
+        n = len(rewards)
+        with self.lock:
+            idx = (self.data_pointer + np.arange(n)) % self.capacity
+            self.states[idx] = states
+            self.actions[idx] = actions
+            self.rewards[idx] = rewards
+            self.next_states[idx] = next_states
+            self.dones[idx] = dones
+
+            self.data_pointer = (self.data_pointer + n) % self.capacity
+            self.size = min(self.size + n, self.capacity)
+        return idx
+
+    def clear(self):
+        # forgets the stored transitions, the arrays are left as they are
+        with self.lock:
+            self.data_pointer = 0
+            self.size = 0
+
+    def sample_idx(self, n):
+        # n distinct slots, like the random.sample the agents used before; Generator.choice does not shuffle
+        # the whole buffer for it when n is small
+        return self.rng.choice(self.size, n, replace=False)
+
+    def get(self, idx):
+        """
+        Returns (states, actions, rewards, next_states, dones) tensors for the given slots.
+        Fancy indexing already produces fresh arrays, from_numpy only wraps them.
+        """
+        return (t.from_numpy(self.states[idx]),
+                t.from_numpy(self.actions[idx]),
+                t.from_numpy(self.rewards[idx]),
+                t.from_numpy(self.next_states[idx]),
+                t.from_numpy(self.dones[idx]))
+
+    def sample(self, n):
+        return self.get(self.sample_idx(n))
+
+    def state_dict(self):
+        return {'states': self.states, 'actions': self.actions, 'rewards': self.rewards,
+                'next_states': self.next_states, 'dones': self.dones,
+                'data_pointer': self.data_pointer, 'size': self.size}
+
+    def load_state_dict(self, state):
+        """
+        Copies a saved buffer into this one, which must have the same capacity and layout.
+        The saved arrays may be read-only memory maps (common.checkpoint).
+        """
+        with self.lock:
+            for name in ('states', 'actions', 'rewards', 'next_states', 'dones'):
+                getattr(self, name)[...] = state[name]
+            self.data_pointer = int(state['data_pointer'])
+            self.size = int(state['size'])
+
+
+class MemmapReplayBuffer(ReplayBuffer):
+    """
+    ReplayBuffer whose arrays live in np.memmap files under `directory` (one .dat file per field),
+    so the capacity is bounded by disk instead of RAM; the OS page cache keeps the hot part in memory.
+    Same store/sample API as ReplayBuffer. With resume=True existing files are reopened and the
+    pointer/size saved by the last flush() are restored, otherwise the files are created anew (truncated).
+    meta.json records the layout, reopening files of another capacity, state_dim or dtype raises ValueError.
+    """
+
+    def __init__(self, capacity, state_dim, directory, action_shape=(), action_dtype=np.int64, dtype=np.float32,
+                 resume=False):
+        self.directory = directory
+        self.mode = 'r+' if resume and os.path.exists(os.path.join(directory, 'meta.json')) else 'w+'
+        self.maps = []
+        os.makedirs(directory, exist_ok=True)
+        if self.mode == 'r+':   # before mapping: files of another layout would be mapped with the wrong shape
+            meta = self._check_meta(capacity, state_dim, dtype)
+        ReplayBuffer.__init__(self, capacity, state_dim, action_shape, action_dtype, dtype)
+        if self.mode == 'r+':
+            self.data_pointer = meta['data_pointer']
+            self.size = meta['size']
+
+    def _check_meta(self, capacity, state_dim, dtype):
+        try:
+            with open(os.path.join(self.directory, 'meta.json')) as f:
+                meta = json.load(f)
+        except FileNotFoundError:
+            raise ValueError('no replay files in %s' % self.directory)
+        expected = {'capacity': capacity, 'state_dim': state_dim, 'dtype': np.dtype(dtype).name}
+        for key, value in expected.items():
+            if meta.get(key, value) != value:   # files written before state_dim/dtype were recorded pass
+                raise ValueError('replay files in %s have %s %s, not %s' % (self.directory, key, meta[key], value))
+        return meta
+
+    def _allocate(self, name, shape, dtype):
+        m = np.memmap(os.path.join(self.directory, name + '.dat'), dtype=dtype, mode=self.mode, shape=shape)
+        self.maps.append(m)
+        return np.asarray(m)    # plain ndarray view of the mapping, torch.from_numpy takes it as is
+
+    def flush(self):
+        """
+        Writes dirty pages and the ring position to disk.
+        """
+        with self.lock:
+            for m in self.maps:
+                m.flush()
+            meta = {'capacity': self.capacity, 'state_dim': self.state_dim, 'dtype': self.states.dtype.name,
+                    'data_pointer': self.data_pointer, 'size': self.size}
+        tmp = os.path.join(self.directory, 'meta.json.tmp')
+        with open(tmp, 'w') as f:
+            json.dump(meta, f)
+        os.replace(tmp, os.path.join(self.directory, 'meta.json'))
+
+    def state_dict(self):
+        # the data is already on disk: a checkpoint only records where the ring stands
+        self.flush()
+        return {'directory': self.directory, 'data_pointer': self.data_pointer, 'size': self.size}
+
+    def load_state_dict(self, state):
+        if 'states' in state:   # checkpoint of an in-memory buffer
+            ReplayBuffer.load_state_dict(self, state)
+            return
+        # the checkpoint only points into the files: they must be the ones it was taken from, not new empty ones
+        if self.mode != 'r+':
+            raise ValueError('the checkpoint refers to replay files in %s, open them with resume=True' % state['directory'])
+        self._check_meta(self.capacity, self.state_dim, self.states.dtype)
+        with self.lock:
+            self.data_pointer = int(state['data_pointer'])
+            self.size = int(state['size'])
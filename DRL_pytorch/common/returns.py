@@ -0,0 +1,79 @@
+import numpy as np
+
+BLOCK = 64  # time steps per matrix product in discounted_returns
+
+
+def pad_episodes(sequences, value=0.):
+    """
+    Stack variable-length sequences into a [num_episodes, T] array padded with `value`.
+    Returns the padded array and a boolean mask that is True on real steps;
+    array[mask] gives the steps back in episode order.
+    """
+    lengths = np.array([len(seq) for seq in sequences])
+    mask = np.arange(lengths.max()) < lengths[:, None]
+    padded = np.full(mask.shape, value, dtype=np.float64)
+    padded[mask] = np.concatenate([np.asarray(seq, dtype=np.float64) for seq in sequences])
+    return padded, mask
+
+def discounted_returns(rewards, gamma, dones=None, last_values=None):
+    """
+    G_t = r_t + gamma * G_{t+1} for every row of a [num_episodes, T] reward array at once.
+    Padding after the end of an episode must be 0 (see pad_episodes).
+    dones:       optional [num_episodes, T], 1 where an episode ends at step t, nothing is carried across it.
+    last_values: optional [num_episodes], value of the state after step T-1, bootstrapped unless done there.
+    Time is processed in blocks of BLOCK steps from the end, each one a single product with the
+    gamma^(k-t) weights of the block (0 where a done lies between t and k), so a python-level
+    iteration covers BLOCK steps of all episodes.
+    """
+    rewards = np.asarray(rewards, dtype=np.float64)
+    dones = np.zeros(rewards.shape, dtype=np.int64) if dones is None else (np.asarray(dones) != 0).astype(np.int64)
+    returns = np.empty_like(rewards)
+    running = np.zeros(len(rewards)) if last_values is None else np.asarray(last_values, dtype=np.float64)
+    for end in range(rewards.shape[1], 0, -BLOCK):
+        start = max(end - BLOCK, 0)
+        b = end - start
+        crossed = np.zeros((len(rewards), b + 1), dtype=np.int64)  # crossed[:, k]: dones before step k of the block
+        np.cumsum(dones[:, start:end], axis=1, out=crossed[:, 1:])
+        steps = np.arange(b + 1)
+        lag = steps[None, :] - steps[:b, None]   # [b, b+1]: k - t, column b is the state after the block
+        weights = np.where(lag >= 0, gamma ** np.maximum(lag, 0), 0.) * (crossed[:, None, :] == crossed[:, :b, None])
+        block = np.einsum('etk,ek->et', weights[:, :, :b], rewards[:, start:end]) + weights[:, :, b] * running[:, None]
+        returns[:, start:end] = block
+        running = block[:, 0]
+    return returns
+
+def n_step_targets(rewards, values, dones, gamma, n):
+    """
+    sum_{k<m} gamma^k r_{t+k} + gamma^m V(s_{t+m}), with m = min(n, T-t), cut at the first done.
+    rewards, dones: [num_episodes, T]; values: [num_episodes, T+1], values[:, T] is the bootstrap value.
+    """
+    rewards = np.asarray(rewards, dtype=np.float64)
+    dones = np.asarray(dones, dtype=np.float64)
+    values = np.asarray(values, dtype=np.float64)
+    T = rewards.shape[1]
+    steps = np.arange(T)
+    targets = np.zeros_like(rewards)
+    discount = np.ones(T)
+    alive = np.ones_like(rewards)   # no done yet between t and t+k
+    for k in range(n):
+        valid = steps + k < T
+        idx = np.minimum(steps + k, T - 1)
+        targets += discount * rewards[:, idx] * alive * valid
+        alive = alive * (1. - dones[:, idx] * valid)
+        discount = discount * np.where(valid, gamma, 1.)
+    bootstrap_idx = np.minimum(steps + n, T)
+    targets += discount * values[:, bootstrap_idx] * alive
+    return targets
+
+def gae(rewards, values, dones, gamma, lam):
+    """
+    Generalized advantage estimation over [num_episodes, T] rollouts.
+    values: [num_episodes, T+1], values[:, T] is the value of the state after the last step.
+    Returns (advantages, value targets = advantages + V(s_t)).
+    """
+    rewards = np.asarray(rewards, dtype=np.float64)
+    dones = np.asarray(dones, dtype=np.float64)
+    values = np.asarray(values, dtype=np.float64)
+    deltas = rewards + gamma * values[:, 1:] * (1. - dones) - values[:, :-1]
+    advantages = discounted_returns(deltas, gamma * lam, dones)
+    return advantages, advantages + values[:, :-1]
@@ -0,0 +1,53 @@
+import glob
+import importlib.machinery
+import importlib.util
+import os
+import pickle
+import types
+import torch as t
+
+
+def load_script(path):
+    """
+    Imports a training script by file path (.py or .PY) as a module, without running its main().
+    """
+    name = os.path.splitext(os.path.basename(path))[0]
+    loader = importlib.machinery.SourceFileLoader(name, path)
+    spec = importlib.util.spec_from_loader(name, loader)
+    module = importlib.util.module_from_spec(spec)
+    loader.exec_module(module)
+    return module
+
+def find_script(model_path):
+    # the scripts save their models next to themselves
+    directory = os.path.dirname(os.path.abspath(model_path))
+    scripts = glob.glob(os.path.join(directory, '*.py')) + glob.glob(os.path.join(directory, '*.PY'))
+    if len(scripts) != 1:
+        raise ValueError('cannot tell which script defines the model in %s, pass it explicitly' % directory)
+    return scripts[0]
+
+
+def _script_pickle(script):
+    """
+    pickle module for torch.load: the scripts run as __main__ when they t.save(net, ...),
+    so classes pickled from '__main__' are looked up in the given script module instead.
+    """
+    class Unpickler(pickle.Unpickler):
+        def find_class(self, module, name):
+            if module == '__main__':
+                return getattr(script, name)
+            return pickle.Unpickler.find_class(self, module, name)
+
+    module = types.ModuleType('script_pickle')
+    module.Unpickler = Unpickler
+    module.UnpicklingError = pickle.UnpicklingError
+    module.load = lambda f, **kwargs: Unpickler(f, **kwargs).load()
+    return module
+
+def load_model(model_path, script_path=None):
+    """
+    Loads a whole module saved with t.save(net, path) by one of the training scripts.
+    script_path defaults to the only script in the model's directory.
+    """
+    script = load_script(script_path or find_script(model_path))
+    return t.load(model_path, map_location='cpu', pickle_module=_script_pickle(script))
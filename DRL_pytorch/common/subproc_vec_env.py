@@ -0,0 +1,127 @@
+import multiprocessing as mp
+import numpy as np
+
+
+def _shared_array(shape, dtype):
+    dtype = np.dtype(dtype)
+    raw = mp.RawArray('b', int(np.prod(shape)) * dtype.itemsize)
+    return raw, shape, dtype
+
+def _as_numpy(spec):
+    raw, shape, dtype = spec
+    return np.frombuffer(raw, dtype=dtype).reshape(shape)
+
+def _worker(remote, parent_remote, env_fn, index, buffers):
+    parent_remote.close()
+    env = env_fn()
+    obs, final_obs, rewards, dones, truncated, actions = [_as_numpy(spec) for spec in buffers]
+    discrete = hasattr(env.action_space, 'n')
+    try:
+        while True:
+            cmd = remote.recv()
+            if cmd == 'step':
+                action = int(actions[index]) if discrete else actions[index].copy()
+                ob, reward, done, info = env.step(action)
+                final_obs[index] = ob
+                rewards[index] = reward
+                dones[index] = done
+                truncated[index] = info.get('TimeLimit.truncated', False)
+                if done:    # auto reset
+                    ob = env.reset()
+                obs[index] = ob
+                remote.send(True)
+            elif cmd == 'reset':
+                obs[index] = env.reset()
+                remote.send(True)
+            elif cmd == 'close':
+                break
+    finally:
+        env.close()
+        remote.close()
+
+
+class SubprocVecEnv(object):
+    """
+    Runs one gym env per worker process. Actions, observations, rewards and dones are exchanged
+    through preallocated shared-memory arrays; the pipes only carry a short command and an ack.
+
+    Same contract as common.vec_env.VecEnv: step(actions) returns (obs, rewards, dones, infos),
+    finished envs are reset at once and infos['final_obs'] holds the real next observations.
+    step_async(actions)/step_wait() split a step so the caller can work while the envs step.
+    """
+
+    def __init__(self, env_fns):
+        self.num_envs = len(env_fns)
+        dummy = env_fns[0]()    # only to read the spaces
+        self.observation_space = dummy.observation_space
+        self.action_space = dummy.action_space
+        dummy.close()
+
+        obs_shape = (self.num_envs,) + tuple(self.observation_space.shape)
+        self.buffers = [_shared_array(obs_shape, np.float64),          # obs
+                        _shared_array(obs_shape, np.float64),          # final_obs
+                        _shared_array((self.num_envs,), np.float64),   # rewards
+                        _shared_array((self.num_envs,), np.bool_),     # dones
+                        _shared_array((self.num_envs,), np.bool_),     # truncated
+                        _shared_array((self.num_envs,) + tuple(self.action_space.shape), np.float64)]  # actions
+        self.obs, self.final_obs, self.rewards, self.dones, self.truncated, self.actions = \
+            [_as_numpy(spec) for spec in self.buffers]
+        self.episode_returns = np.zeros(self.num_envs)
+        self.episode_lengths = np.zeros(self.num_envs, dtype=np.int64)
+
+        self.remotes, work_remotes = zip(*[mp.Pipe() for _ in range(self.num_envs)])
+        self.processes = []
+        for index, (work_remote, remote, env_fn) in enumerate(zip(work_remotes, self.remotes, env_fns)):
+            p = mp.Process(target=_worker, args=(work_remote, remote, env_fn, index, self.buffers), daemon=True)
+            p.start()
+            self.processes.append(p)
+            work_remote.close()
+        self.waiting = False
+        self.closed = False
+
+    def reset(self):
+        for remote in self.remotes:
+            remote.send('reset')
+        for remote in self.remotes:
+            remote.recv()
+        self.episode_returns[:] = 0
+        self.episode_lengths[:] = 0
+        return self.obs.copy()
+
+    def step_async(self, actions):
+        self.actions[:] = np.asarray(actions).reshape(self.actions.shape)
+        for remote in self.remotes:
+            remote.send('step')
+        self.waiting = True
+
+    def step_wait(self):
+        for remote in self.remotes:
+            remote.recv()
+        self.waiting = False
+
+        rewards = self.rewards.copy()
+        dones = self.dones.copy()
+        self.episode_returns += rewards
+        self.episode_lengths += 1
+        infos = {'final_obs': self.final_obs.copy(),
+                 'episode_returns': self.episode_returns.copy(),
+                 'episode_lengths': self.episode_lengths.copy(),
+                 'truncated': self.truncated.copy()}
+        self.episode_returns[dones] = 0
+        self.episode_lengths[dones] = 0
+        return self.obs.copy(), rewards, dones, infos
+
+    def step(self, actions):
+        self.step_async(actions)
+        return self.step_wait()
+
+    def close(self):
+        if self.closed:
+            return
+        if self.waiting:
+            self.step_wait()
+        for remote in self.remotes:
+            remote.send('close')
+        for p in self.processes:
+            p.join()
+        self.closed = True
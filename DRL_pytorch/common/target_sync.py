@@ -0,0 +1,44 @@
+import torch as t
+
+
+def flatten_parameters(net):
+    """
+    Moves all parameters of net into one contiguous 1-D tensor and points every parameter at its slice.
+    The Parameter objects stay the same, so optimizers built before or after keep working.
+    Returns the flat tensor. All parameters must share one dtype and device.
+    """
+    params = list(net.parameters())
+    dtypes = set(p.dtype for p in params)
+    if len(dtypes) != 1:
+        raise ValueError('flatten_parameters needs a single parameter dtype, got %s' % sorted(map(str, dtypes)))
+    flat = t.empty(sum(p.numel() for p in params), dtype=params[0].dtype, device=params[0].device)
+    offset = 0
+    for p in params:
+        n = p.numel()
+        flat[offset:offset + n].copy_(p.data.view(-1))
+        p.data = flat[offset:offset + n].view_as(p)
+        offset += n
+    return flat
+
+
+class TargetSync(object):
+    """
+    Keeps the parameters of an online net and its target net in two flat buffers of the same layout,
+    so a target update is a single in-place op over one contiguous block:
+    soft_update(tau) is target += tau * (online - target) via lerp_, hard_update() is copy_.
+    Both nets must have the same architecture. Only parameters are synced, not module buffers.
+    """
+
+    def __init__(self, current_net, target_net):
+        self.current = flatten_parameters(current_net)
+        self.target = flatten_parameters(target_net)
+        if self.current.shape != self.target.shape:
+            raise ValueError('current and target nets have different parameter sizes')
+
+    @t.no_grad()
+    def soft_update(self, tau):
+        self.target.lerp_(self.current, tau)
+
+    @t.no_grad()
+    def hard_update(self):
+        self.target.copy_(self.current)
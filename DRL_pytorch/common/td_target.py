@@ -0,0 +1,28 @@
+import torch as t
+
+
+def q_selected(q_values, actions):
+    """
+    Q(s,a) of the taken actions, picked with gather on integer actions
+    instead of multiplying by a one-hot matrix and summing.
+    """
+    return q_values.gather(1, actions.view(-1, 1)).squeeze(1)
+
+
+def max_q_target(target_net, rewards, next_states, dones, gamma):
+    """
+    r + gamma * max_a' Q(s',a') for a whole batch, bootstrapping masked out on done.
+    """
+    with t.no_grad():
+        next_q = target_net(next_states).max(1)[0]
+        return rewards + gamma * (1 - dones) * next_q
+
+
+def double_q_target(current_net, target_net, rewards, next_states, dones, gamma):
+    """
+    Double DQN target: the current net picks a' = argmax_a Q(s',a), the target net evaluates it.
+    """
+    with t.no_grad():
+        next_actions = current_net(next_states).argmax(1)
+        next_q = q_selected(target_net(next_states), next_actions)
+        return rewards + gamma * (1 - dones) * next_q
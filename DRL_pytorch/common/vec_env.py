@@ -0,0 +1,157 @@
+import numpy as np
+
+
+class Discrete(object):
+    def __init__(self, n):
+        self.n = n
+        self.shape = ()
+
+
+class Box(object):
+    def __init__(self, low, high):
+        self.low = np.asarray(low, dtype=np.float64)
+        self.high = np.asarray(high, dtype=np.float64)
+        self.shape = self.low.shape
+
+
+class VecEnv(object):
+    """
+    N copies of one environment stepped in lockstep as arrays, without gym.
+    observation_space/action_space describe a single copy, like gym.make(ENV_NAME) does,
+    so agents can be built with the vector env in place of the gym one.
+
+    step(actions) returns (obs, rewards, dones, infos) with a leading num_envs axis.
+    A copy that is done is reset at once, so obs holds its first observation of the next episode;
+    infos['final_obs'] holds the real next observation of every copy (the terminal one where done),
+    infos['episode_returns']/infos['episode_lengths'] the totals of the episodes that just ended
+    (valid where done) and infos['truncated'] marks episodes cut by the time limit.
+    """
+    max_episode_steps = 200   # TimeLimit of CartPole-v0 and Pendulum-v0
+
+    def __init__(self, num_envs, seed=None):
+        self.num_envs = num_envs
+        self.np_random = np.random.RandomState(seed)
+        self.episode_returns = np.zeros(num_envs)
+        self.episode_lengths = np.zeros(num_envs, dtype=np.int64)
+
+    def _reset_idx(self, idx):
+        raise NotImplementedError
+
+    def _obs(self):
+        raise NotImplementedError
+
+    def _step(self, actions):   # advance every copy, returns (rewards, terminated)
+        raise NotImplementedError
+
+    def reset(self):
+        self._reset_idx(np.arange(self.num_envs))
+        self.episode_returns[:] = 0
+        self.episode_lengths[:] = 0
+        return self._obs()
+
+    def step(self, actions):
+        rewards, terminated = self._step(np.asarray(actions))
+        self.episode_returns += rewards
+        self.episode_lengths += 1
+        truncated = ~terminated & (self.episode_lengths >= self.max_episode_steps)
+        dones = terminated | truncated
+        infos = {'final_obs': self._obs(),
+                 'episode_returns': self.episode_returns.copy(),
+                 'episode_lengths': self.episode_lengths.copy(),
+                 'truncated': truncated}
+
+        done_idx = np.flatnonzero(dones)
+        if done_idx.size:    # auto reset
+            self._reset_idx(done_idx)
+            self.episode_returns[done_idx] = 0
+            self.episode_lengths[done_idx] = 0
+        return self._obs(), rewards, dones, infos
+
+    def close(self):
+        pass
+
+
+class CartPoleVecEnv(VecEnv):
+    """
+    Dynamics of gym's CartPole-v0 (classic_control/cartpole.py), euler integration.
+    """
+    gravity = 9.8
+    masscart = 1.0
+    masspole = 0.1
+    total_mass = masspole + masscart
+    length = 0.5  # actually half the pole's length
+    polemass_length = masspole * length
+    force_mag = 10.0
+    tau = 0.02  # seconds between state updates
+    theta_threshold_radians = 12 * 2 * np.pi / 360
+    x_threshold = 2.4
+
+    def __init__(self, num_envs, seed=None):
+        VecEnv.__init__(self, num_envs, seed)
+        high = np.array([self.x_threshold * 2, np.finfo(np.float32).max,
+                         self.theta_threshold_radians * 2, np.finfo(np.float32).max])
+        self.observation_space = Box(-high, high)
+        self.action_space = Discrete(2)
+        self.state = np.zeros((num_envs, 4))
+
+    def _reset_idx(self, idx):
+        self.state[idx] = self.np_random.uniform(low=-0.05, high=0.05, size=(len(idx), 4))
+
+    def _obs(self):
+        return self.state.copy()
+
+    def _step(self, actions):
+        x, x_dot, theta, theta_dot = self.state.T
+        force = np.where(actions == 1, self.force_mag, -self.force_mag)
+        costheta = np.cos(theta)
+        sintheta = np.sin(theta)
+        temp = (force + self.polemass_length * theta_dot * theta_dot * sintheta) / self.total_mass
+        thetaacc = (self.gravity * sintheta - costheta * temp) / \
+            (self.length * (4.0 / 3.0 - self.masspole * costheta * costheta / self.total_mass))
+        xacc = temp - self.polemass_length * thetaacc * costheta / self.total_mass
+        self.state = np.stack((x + self.tau * x_dot,
+                               x_dot + self.tau * xacc,
+                               theta + self.tau * theta_dot,
+                               theta_dot + self.tau * thetaacc), axis=1)
+
+        x, theta = self.state[:, 0], self.state[:, 2]
+        terminated = (np.abs(x) > self.x_threshold) | (np.abs(theta) > self.theta_threshold_radians)
+        return np.ones(self.num_envs), terminated
+
+
+class PendulumVecEnv(VecEnv):
+    """
+    Dynamics of gym's Pendulum-v0 (classic_control/pendulum.py), which never terminates on its own.
+    """
+    max_speed = 8
+    max_torque = 2.
+    dt = .05
+    g = 10.0
+    m = 1.
+    l = 1.
+
+    def __init__(self, num_envs, seed=None):
+        VecEnv.__init__(self, num_envs, seed)
+        high = np.array([1., 1., self.max_speed])
+        self.observation_space = Box(-high, high)
+        self.action_space = Box([-self.max_torque], [self.max_torque])
+        self.th = np.zeros(num_envs)
+        self.thdot = np.zeros(num_envs)
+
+    def _reset_idx(self, idx):
+        self.th[idx] = self.np_random.uniform(low=-np.pi, high=np.pi, size=len(idx))
+        self.thdot[idx] = self.np_random.uniform(low=-1, high=1, size=len(idx))
+
+    def _obs(self):
+        return np.stack((np.cos(self.th), np.sin(self.th), self.thdot), axis=1)
+
+    def _step(self, actions):
+        th, thdot = self.th, self.thdot
+        u = np.clip(actions.reshape(self.num_envs), -self.max_torque, self.max_torque)
+        angle = ((th + np.pi) % (2 * np.pi)) - np.pi   # angle_normalize
+        costs = angle ** 2 + .1 * thdot ** 2 + .001 * (u ** 2)
+
+        newthdot = thdot + (-3 * self.g / (2 * self.l) * np.sin(th + np.pi) + 3. / (self.m * self.l ** 2) * u) * self.dt
+        self.th = th + newthdot * self.dt
+        self.thdot = np.clip(newthdot, -self.max_speed, self.max_speed)
+        return -costs, np.zeros(self.num_envs, dtype=bool)
@@ -0,0 +1,50 @@
+import os
+import sys
+import threading
+import time
+import pytest
+sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from common.checkpoint import Checkpointer
+
+
+def failing_checkpointer(directory):
+    checkpointer = Checkpointer(directory, interval=1)
+    def _write(tag, state):
+        raise OSError('disk full')
+    checkpointer._write = _write
+    return checkpointer
+
+def wait_for_error(checkpointer, timeout=5.):
+    deadline = time.time() + timeout
+    while checkpointer.error is None and time.time() < deadline:
+        time.sleep(0.01)
+    assert checkpointer.error is not None
+
+def call_with_timeout(fn, timeout=5.):
+    # the failure this guards against is a hang: run fn in a thread and fail if it does not return
+    result = {}
+    def target():
+        try:
+            fn()
+        except Exception as e:
+            result['error'] = e
+    thread = threading.Thread(target=target, daemon=True)
+    thread.start()
+    thread.join(timeout)
+    assert not thread.is_alive(), 'call blocked'
+    return result.get('error')
+
+def test_failed_write_raises_on_next_save(tmp_path):
+    checkpointer = failing_checkpointer(str(tmp_path))
+    checkpointer.save(1, {'x': 1})
+    wait_for_error(checkpointer)
+    error = call_with_timeout(lambda: checkpointer.maybe_save(2, lambda: {'x': 2}))
+    assert isinstance(error, OSError)
+    assert call_with_timeout(lambda: checkpointer.save(3, {'x': 3})) is None   # reported once, worker still alive
+    assert isinstance(call_with_timeout(checkpointer.close), OSError)
+
+def test_failed_write_raises_on_close(tmp_path):
+    checkpointer = failing_checkpointer(str(tmp_path))
+    checkpointer.save(1, {'x': 1})
+    with pytest.raises(OSError):
+        checkpointer.close()
@@ -0,0 +1,53 @@
+import os
+import sys
+import numpy as np
+import pytest
+sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from common.compact_replay import CompactReplayBuffer
+
+
+def episodes(buffer, lengths):
+    # state i+1 follows state i within an episode, every episode starts from a new value
+    transitions = []
+    start = 0.
+    for length in lengths:
+        for i in range(length):
+            state, next_state = np.full(4, start + i), np.full(4, start + i + 1)
+            done = i == length - 1
+            buffer.store(state, i % 2, float(i), next_state, done)
+            transitions.append((state[0], i % 2, float(i), next_state[0], done))
+        start += 100.
+    return transitions
+
+def test_next_states_are_reconstructed():
+    buffer = CompactReplayBuffer(1000, 4, obs_dtype=np.float32)
+    transitions = episodes(buffer, [5, 3, 7])
+    assert len(buffer) == len(transitions)    # frame-only terminal slots are not counted
+    assert buffer.size == len(transitions) + 3
+    states, actions, rewards, next_states, dones = buffer.sample(len(transitions))
+    got = sorted(zip(states[:, 0].tolist(), actions.tolist(), rewards.tolist(), next_states[:, 0].tolist(),
+                     dones.bool().tolist()))
+    assert got == sorted((s, a, r, s2, bool(d)) for s, a, r, s2, d in transitions)
+
+def test_next_states_after_wrapping():
+    buffer = CompactReplayBuffer(20, 4, obs_dtype=np.float32)
+    episodes(buffer, [6, 6, 6, 6])
+    states, _, _, next_states, dones = buffer.sample(len(buffer))
+    assert len(np.unique(states[:, 0].numpy())) == len(buffer)
+    assert (next_states.numpy() == states.numpy() + 1).all()
+
+def test_minibatch_without_replacement():
+    buffer = CompactReplayBuffer(1000, 4, obs_dtype=np.float32)
+    episodes(buffer, [10] * 5)
+    for _ in range(20):
+        idx = buffer.sample_idx(40)
+        assert len(np.unique(idx)) == 40
+    with pytest.raises(ValueError):
+        buffer.sample_idx(len(buffer) + 1)
+
+def test_len_after_load_state_dict():
+    buffer = CompactReplayBuffer(100, 4)
+    episodes(buffer, [4, 4])
+    restored = CompactReplayBuffer(100, 4)
+    restored.load_state_dict(buffer.state_dict())
+    assert len(restored) == len(buffer) == 8
@@ -0,0 +1,27 @@
+import argparse
+import os
+import sys
+import numpy as np
+import pytest
+sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from common.replay_buffer import ReplayBuffer
+from common.vec_env import CartPoleVecEnv
+from tools.compare_learners import Learner,run
+
+
+@pytest.mark.parametrize('name', ['nature', 'double', 'dueling', 'per'])
+def test_egreedy_action_on_a_batch(name):
+    env = CartPoleVecEnv(8, seed=0)
+    learner = Learner(name, env, ReplayBuffer(100, 4))
+    actions = learner.agent.egreedy_action(env.reset())
+    assert np.shape(actions) == (8,)
+    learner.agent.close()
+
+@pytest.mark.parametrize('behaviour', ['double', 'dueling', 'per'])
+def test_run_with_vector_env(tmp_path, behaviour):
+    args = argparse.Namespace(learners=['nature', behaviour], behaviour=behaviour, num_envs=4, episodes=8,
+                              replay_size=1000, updates_per_step=1, eval_every=1000, test=1, seed=0,
+                              out=str(tmp_path))
+    run(args)
+    for name in args.learners:
+        assert os.path.exists(os.path.join(str(tmp_path), name + '.jsonl'))
@@ -0,0 +1,63 @@
+import os
+import sys
+import numpy as np
+import torch as t
+from torch import nn
+sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from common.ensemble import EnsembleMLP,EnsembleReplayBuffer,EnsembleSGD
+
+
+def separate_nets(k, sizes):
+    return [[nn.Linear(n_in, n_out) for n_in, n_out in zip(sizes[:-1], sizes[1:])] for _ in range(k)]
+
+def forward(layers, x):
+    for i, l in enumerate(layers):
+        x = l(x)
+        if i < len(layers) - 1:
+            x = t.relu(x)
+    return x
+
+def test_forward_and_gradients_match_separate_nets():
+    t.manual_seed(0)
+    members = separate_nets(3, [4, 15, 2])
+    ensemble = EnsembleMLP.from_linears(members)
+    x = t.randn(3, 8, 4)
+    out = ensemble(x)
+    out.pow(2).sum().backward()
+    for k, layers in enumerate(members):
+        expected = forward(layers, x[k])
+        assert t.allclose(out[k], expected, atol=1e-6)
+        expected.pow(2).sum().backward()
+        for w, b, l in zip(ensemble.weights, ensemble.biases, layers):
+            assert t.allclose(w.grad[k], l.weight.grad.t(), atol=1e-5)
+            assert t.allclose(b.grad[k, 0], l.bias.grad, atol=1e-5)
+
+def test_sgd_step_matches_per_member_lr():
+    t.manual_seed(0)
+    members = separate_nets(2, [4, 3])
+    ensemble = EnsembleMLP.from_linears(members)
+    optimizer = EnsembleSGD(ensemble.parameters(), lr=[0.1, 0.01])
+    x = t.randn(2, 5, 4)
+    ensemble(x).sum().backward()
+    optimizer.step()
+    for k, (layers, lr) in enumerate(zip(members, (0.1, 0.01))):
+        forward(layers, x[k]).sum().backward()
+        with t.no_grad():
+            for l in layers:
+                l.weight -= lr * l.weight.grad
+                l.bias -= lr * l.bias.grad
+        copy = [nn.Linear(4, 3)]
+        ensemble.copy_member_to(k, copy)
+        assert t.allclose(copy[0].weight, layers[0].weight, atol=1e-6)
+        assert t.allclose(copy[0].bias, layers[0].bias, atol=1e-6)
+
+def test_replay_minibatch_without_replacement():
+    buffer = EnsembleReplayBuffer(3, 100, 4, seeds=range(3))
+    for i in range(40):
+        states = np.full((3, 4), i + 1.)
+        buffer.store_batch(states, np.zeros(3), np.ones(3), states + 1., np.zeros(3))
+    states, _, _, next_states, _ = buffer.sample(32)
+    assert states.shape == (3, 32, 4)
+    for k in range(3):
+        assert len(np.unique(states[k, :, 0].numpy())) == 32
+    assert (next_states.numpy() == states.numpy() + 1).all()
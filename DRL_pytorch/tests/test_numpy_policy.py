@@ -0,0 +1,39 @@
+import os
+import sys
+import numpy as np
+import torch as t
+from torch import nn
+sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from common.numpy_policy import NumpyMLP
+
+
+def test_matches_torch_forward():
+    t.manual_seed(0)
+    layers = [nn.Linear(4, 15), nn.Linear(15, 2)]
+    fast = NumpyMLP(layers)
+    x = np.random.randn(8, 4).astype(np.float32)
+    with t.no_grad():
+        expected = layers[1](t.relu(layers[0](t.from_numpy(x)))).numpy()
+    assert np.allclose(fast(x), expected, atol=1e-6)
+    assert np.allclose(fast(x[0]), expected[0], atol=1e-6)
+
+def test_output_fn_and_double():
+    layers = [nn.Linear(3, 5).double(), nn.Linear(5, 1).double()]
+    fast = NumpyMLP(layers, output_fn=lambda out: np.tanh(out, out=out))
+    x = np.random.randn(6, 3)
+    with t.no_grad():
+        expected = t.tanh(layers[1](t.relu(layers[0](t.from_numpy(x))))).numpy()
+    assert fast(x).dtype == np.float64
+    assert np.allclose(fast(x), expected)
+
+def test_refresh_swaps_in_new_weights():
+    layers = [nn.Linear(4, 2)]
+    fast = NumpyMLP(layers)
+    old_weights, _ = fast.params
+    before = old_weights[0].copy()
+    with t.no_grad():
+        layers[0].weight.add_(1.)
+    assert np.array_equal(fast.params[0][0], before)    # a copy, not a view of the torch weights
+    fast.refresh()
+    assert np.array_equal(old_weights[0], before)       # a forward still holding the old arrays is unaffected
+    assert np.allclose(fast.params[0][0], layers[0].weight.detach().numpy().T)
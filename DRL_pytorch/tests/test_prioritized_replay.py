@@ -0,0 +1,54 @@
+import os
+import sys
+import numpy as np
+sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from common.prioritized_replay import MaxTree,MinTree,SumTree
+
+
+def filled_tree(capacity, seed=0):
+    rng = np.random.RandomState(seed)
+    tree = SumTree(capacity)
+    for i in range(capacity):
+        tree.update(i + capacity - 1, rng.rand() + 0.01)
+    return tree
+
+def test_get_leaves_matches_get_leaf():
+    for capacity in (8, 13, 100):   # power of 2 or not: leaves at one or two depths
+        tree = filled_tree(capacity)
+        values = np.random.RandomState(1).uniform(0, tree.total_p, size=200)
+        leaf_idx, priorities = tree.get_leaves(values)
+        expected = [tree.get_leaf(v) for v in values]
+        assert leaf_idx.tolist() == [idx for idx, _ in expected]
+        assert np.allclose(priorities, [p for _, p in expected])
+
+def test_batch_update_matches_update():
+    for capacity in (8, 13, 100):
+        batched, single = filled_tree(capacity), filled_tree(capacity)
+        rng = np.random.RandomState(2)
+        tree_idx = rng.choice(capacity, capacity // 2, replace=False) + capacity - 1
+        ps = rng.rand(len(tree_idx))
+        batched.batch_update(tree_idx, ps)
+        for idx, p in zip(tree_idx, ps):
+            single.update(idx, p)
+        assert np.allclose(batched.tree, single.tree)
+        assert np.isclose(batched.total_p, batched.tree[capacity - 1:].sum())
+
+def test_min_max_roots_track_the_leaves():
+    for capacity in (8, 13, 100):
+        rng = np.random.RandomState(3)
+        leaves = np.full(capacity, np.nan)
+        min_tree, max_tree = MinTree(capacity), MaxTree(capacity)
+        assert min_tree.value == np.inf and max_tree.value == -np.inf    # empty leaves never win
+        for _ in range(50):
+            slot = rng.randint(capacity)
+            leaves[slot] = rng.rand()
+            min_tree.update(slot + capacity - 1, leaves[slot])
+            max_tree.update(slot + capacity - 1, leaves[slot])
+            assert min_tree.value == np.nanmin(leaves)
+            assert max_tree.value == np.nanmax(leaves)
+        slots = rng.choice(capacity, capacity // 2, replace=False)
+        leaves[slots] = rng.rand(len(slots)) * 2
+        min_tree.batch_update(slots + capacity - 1, leaves[slots])
+        max_tree.batch_update(slots + capacity - 1, leaves[slots])
+        assert min_tree.value == np.nanmin(leaves)
+        assert max_tree.value == np.nanmax(leaves)
@@ -0,0 +1,68 @@
+import os
+import sys
+import numpy as np
+import pytest
+sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from common.checkpoint import Checkpointer
+from common.replay_buffer import MemmapReplayBuffer,ReplayBuffer
+
+
+def fill(buffer, n):
+    for i in range(n):
+        state = np.full(4, i + 1.)
+        buffer.store(state, i % 2, 1., state + 1., False)
+
+def test_minibatch_without_replacement():
+    buffer = ReplayBuffer(100, 4)
+    fill(buffer, 40)
+    for _ in range(20):
+        states = buffer.sample(32)[0].numpy()
+        assert len(np.unique(states[:, 0])) == 32
+
+def test_memmap_resume_from_checkpoint(tmp_path):
+    replay_dir = str(tmp_path / 'replay')
+    buffer = MemmapReplayBuffer(100, 4, replay_dir, resume=True)
+    fill(buffer, 50)
+    checkpointer = Checkpointer(str(tmp_path / 'checkpoints'), interval=1)
+    checkpointer.save(1, {'replay': buffer.state_dict()})
+    checkpointer.close()
+    del buffer
+
+    # a restarted script: reopen without truncating, start empty, restore from the checkpoint
+    buffer = MemmapReplayBuffer(100, 4, replay_dir, resume=True)
+    buffer.clear()
+    buffer.load_state_dict(Checkpointer(str(tmp_path / 'checkpoints'), interval=1).load()['replay'])
+    assert len(buffer) == 50
+    states, actions, rewards, next_states, dones = buffer.sample(32)
+    assert (states.numpy() > 0).all()
+    assert (next_states.numpy() == states.numpy() + 1).all()
+
+def test_memmap_checkpoint_needs_the_files(tmp_path):
+    replay_dir = str(tmp_path / 'replay')
+    buffer = MemmapReplayBuffer(100, 4, replay_dir)
+    fill(buffer, 10)
+    state = buffer.state_dict()
+    with pytest.raises(ValueError):
+        MemmapReplayBuffer(100, 4, replay_dir).load_state_dict(state)     # truncated files
+
+def test_memmap_layout_mismatch(tmp_path):
+    replay_dir = str(tmp_path / 'replay')
+    buffer = MemmapReplayBuffer(100, 4, replay_dir)
+    fill(buffer, 10)
+    buffer.flush()
+    with pytest.raises(ValueError):
+        MemmapReplayBuffer(100, 3, replay_dir, resume=True)
+    with pytest.raises(ValueError):
+        MemmapReplayBuffer(100, 4, replay_dir, resume=True, dtype=np.float64)
+
+def test_memmap_fresh_run_recreates_files(tmp_path):
+    replay_dir = str(tmp_path / 'replay')
+    buffer = MemmapReplayBuffer(100, 4, replay_dir)
+    fill(buffer, 10)
+    buffer.flush()
+    del buffer
+    buffer = MemmapReplayBuffer(50, 3, replay_dir)     # not resuming: files of another layout are replaced
+    assert len(buffer) == 0
+    buffer.store(np.ones(3), 0, 1., np.ones(3), False)
+    buffer.flush()
+    assert MemmapReplayBuffer(50, 3, replay_dir, resume=True).states.shape == (50, 3)
@@ -0,0 +1,74 @@
+import os
+import sys
+import numpy as np
+sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from common.returns import discounted_returns,gae,n_step_targets,pad_episodes
+
+
+def rollout(episodes=5, steps=150, seed=0):   # longer than a BLOCK of discounted_returns
+    rng = np.random.RandomState(seed)
+    rewards = rng.randn(episodes, steps)
+    dones = (rng.rand(episodes, steps) < 0.05).astype(np.float64)
+    values = rng.randn(episodes, steps + 1)
+    return rewards, dones, values
+
+def reference_returns(rewards, gamma, dones, last_values):
+    returns = np.zeros_like(rewards)
+    for e in range(len(rewards)):
+        running = last_values[e]
+        for step in reversed(range(rewards.shape[1])):
+            running = rewards[e, step] + gamma * running * (1. - dones[e, step])
+            returns[e, step] = running
+    return returns
+
+def reference_n_step(rewards, values, dones, gamma, n):
+    E, T = rewards.shape
+    targets = np.zeros_like(rewards)
+    for e in range(E):
+        for step in range(T):
+            target, discount = 0., 1.
+            for k in range(step, min(step + n, T)):
+                target += discount * rewards[e, k]
+                discount *= gamma
+                if dones[e, k]:
+                    break
+            else:
+                target += discount * values[e, min(step + n, T)]
+            targets[e, step] = target
+    return targets
+
+def test_discounted_returns_match_loop():
+    rewards, dones, values = rollout()
+    expected = reference_returns(rewards, 0.99, dones, values[:, -1])
+    assert np.allclose(discounted_returns(rewards, 0.99, dones, values[:, -1]), expected)
+    no_dones = reference_returns(rewards, 0.9, np.zeros_like(dones), np.zeros(len(rewards)))
+    assert np.allclose(discounted_returns(rewards, 0.9), no_dones)
+
+def test_discounted_returns_of_padded_episodes():
+    episodes = [[1., 1., 1.], [2.], [0.5] * 70]
+    padded, mask = pad_episodes(episodes)
+    returns = discounted_returns(padded, 0.5)[mask]
+    expected = np.concatenate([reference_returns(np.array([e]), 0.5, np.zeros((1, len(e))), [0.])[0]
+                               for e in episodes])
+    assert np.allclose(returns, expected)
+
+def test_n_step_targets_match_loop():
+    rewards, dones, values = rollout(steps=20)
+    for n in (1, 3, 25):
+        assert np.allclose(n_step_targets(rewards, values, dones, 0.95, n),
+                           reference_n_step(rewards, values, dones, 0.95, n))
+
+def test_gae_matches_loop():
+    rewards, dones, values = rollout()
+    gamma, lam = 0.99, 0.95
+    advantages = np.zeros_like(rewards)
+    for e in range(len(rewards)):
+        running = 0.
+        for step in reversed(range(rewards.shape[1])):
+            not_done = 1. - dones[e, step]
+            delta = rewards[e, step] + gamma * values[e, step + 1] * not_done - values[e, step]
+            running = delta + gamma * lam * running * not_done
+            advantages[e, step] = running
+    got_advantages, targets = gae(rewards, values, dones, gamma, lam)
+    assert np.allclose(got_advantages, advantages)
+    assert np.allclose(targets, advantages + values[:, :-1])
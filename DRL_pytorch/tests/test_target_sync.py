@@ -0,0 +1,38 @@
+import copy
+import os
+import sys
+import torch as t
+from torch import nn
+sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from common.target_sync import TargetSync
+
+
+def nets():
+    t.manual_seed(0)
+    current = nn.Sequential(nn.Linear(4, 15), nn.ReLU(), nn.Linear(15, 2))
+    target = nn.Sequential(nn.Linear(4, 15), nn.ReLU(), nn.Linear(15, 2))
+    return current, target
+
+def test_soft_update_matches_per_parameter_polyak():
+    current, target = nets()
+    expected = copy.deepcopy(target)
+    sync = TargetSync(current, target)
+    for _ in range(3):
+        sync.soft_update(0.005)
+        with t.no_grad():
+            for p_target, p in zip(expected.parameters(), current.parameters()):
+                p_target.copy_(0.005 * p + (1 - 0.005) * p_target)
+    for p_target, p_expected in zip(target.parameters(), expected.parameters()):
+        assert t.allclose(p_target, p_expected, atol=1e-7)
+
+def test_hard_update_and_optimizer_keep_working():
+    current, target = nets()
+    optimizer = t.optim.SGD(current.parameters(), lr=0.1)   # built before flattening
+    sync = TargetSync(current, target)
+    current(t.randn(8, 4)).sum().backward()
+    optimizer.step()
+    sync.hard_update()
+    for p_target, p in zip(target.parameters(), current.parameters()):
+        assert t.equal(p_target, p)
+    x = t.randn(5, 4)
+    assert t.equal(target(x), current(x))
@@ -0,0 +1,156 @@
+"""
+Trains several DQN variants side by side on one stream of experience.
+
+    python tools/compare_learners.py
+    python tools/compare_learners.py nature double --num-envs 8 --episodes 500
+    python tools/compare_learners.py --behaviour random --out runs/random_data
+
+A single behaviour policy steps --num-envs CartPole copies (common.vec_env) and every transition is stored
+once in one ReplayBuffer. Each learner is the agent class of its training script, loaded without running
+the script's main, with its own nets, optimizer and target computation; every env step each one draws its
+own minibatch from the shared store and does one update. The PER learner keeps its own priority trees
+over the shared slots. The behaviour policy is the e-greedy policy of the --behaviour learner, or uniform
+random actions.
+Every learner writes <out>/<name>.jsonl (loss per episode, evaluation rewards of its target net),
+plot each with tools/plot_metrics.py.
+"""
+import argparse
+import os
+import sys
+from functools import partial
+import gym
+import numpy as np
+import torch as t
+sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from common.evaluator import AsyncEvaluator,greedy_action
+from common.metrics import MetricsWriter
+from common.prioritized_replay import Memory
+from common.replay_buffer import ReplayBuffer
+from common.script_loader import load_script
+from common.vec_env import CartPoleVecEnv
+
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+SCRIPTS = {'nature': 'Nature_DQN/Nature_DQN.py',
+           'double': 'Double_DQN/Double_DQN.py',
+           'dueling': 'Dueling_DQN/Dueling_DQN.py',
+           'per': 'prioritised_replay_DDQN/prioritised_replay_DDQN.PY'}
+ENV_NAME = 'CartPole-v0'
+
+
+class Learner(object):
+    """
+    The agent of one training script, reading from the shared replay store instead of its own.
+    loss() is the average loss of the updates since the last call.
+    """
+
+    def __init__(self, name, env, replay):
+        self.name = name
+        self.script = load_script(os.path.join(ROOT, SCRIPTS[name]))
+        self.agent = self.script.Nature_DQN(env)   # every script calls its agent class Nature_DQN
+        self.memory = getattr(self.agent, 'memory', None)
+        if self.memory is not None:     # PER: own priorities over the shared slots
+            self.memory = self.agent.memory = Memory(replay.capacity, replay.state_dim, storage=replay)
+        else:
+            self.agent.replay_buffer = replay
+        self.loss_sum = 0.
+        self.updates = 0
+
+    def added(self, data_idx):
+        if self.memory is not None:
+            self.memory.add(data_idx)
+
+    def update(self):
+        self.loss_sum += self.agent.learn_step()
+        self.updates += 1
+
+    def loss(self):
+        loss = self.loss_sum / self.updates if self.updates else 0.
+        self.loss_sum, self.updates = 0., 0
+        return loss
+
+
+def run(args):
+    os.makedirs(args.out, exist_ok=True)
+    env = CartPoleVecEnv(args.num_envs, seed=args.seed)
+    replay = ReplayBuffer(args.replay_size, env.observation_space.shape[0])
+    learners = [Learner(name, env, replay) for name in args.learners]
+    behaviour = None if args.behaviour == 'random' else learners[args.learners.index(args.behaviour or args.learners[0])]
+    batch_size = max(l.script.BATCH_SIZE for l in learners)
+    metrics = {l.name: MetricsWriter(os.path.join(args.out, l.name + '.jsonl')) for l in learners}
+    evaluators = {l.name: AsyncEvaluator(partial(gym.make, ENV_NAME), l.agent.target_net, greedy_action, args.test)
+                  for l in learners}
+    for m in metrics.values():
+        m.log_start()
+
+    def log_evaluations(name, results):
+        for test_episode, ave_reward in results:
+            print(name, 'episode: ', test_episode, 'Evaluation Average Reward:', ave_reward)
+            metrics[name].log('eval', episode=test_episode, reward=float(ave_reward))
+
+    episode = 0
+    state = env.reset()
+    while episode < args.episodes:
+        if behaviour is None:
+            action = np.random.randint(0, env.action_space.n, size=env.num_envs)
+            epsilon = 1.
+        else:
+            with t.no_grad():
+                action = behaviour.agent.egreedy_action(state)
+            epsilon = behaviour.agent.epsilon
+        next_state, reward, done, infos = env.step(action)
+        reward = np.where(done, -1., reward)   # same reward shaping as the scripts
+        data_idx = replay.store_batch(state, action, reward, infos['final_obs'], done)  # stored once for all learners
+        state = next_state
+        for l in learners:
+            l.added(data_idx)
+            if len(replay) > batch_size:
+                for _ in range(args.updates_per_step):
+                    l.update()
+
+        for steps in infos['episode_lengths'][done]:  # episodes that ended in this step
+            for l in learners:
+                metrics[l.name].log('episode', episode=episode, steps=int(steps), loss=float(l.loss()), epsilon=epsilon)
+            print('episode:', episode, '  steps ：', steps)
+            episode += 1
+            for l in learners:
+                if episode % l.script.UPDATE_FREQUENCY == 0:
+                    l.agent.update_target_net()
+                if episode % args.eval_every == 0:
+                    evaluators[l.name].submit(episode, l.agent.target_net)
+        for name, evaluator in evaluators.items():
+            log_evaluations(name, evaluator.poll())
+
+    for name, evaluator in evaluators.items():
+        log_evaluations(name, evaluator.close())
+    for l in learners:
+        metrics[l.name].close()
+        l.agent.close()
+        t.save(l.agent.target_net.state_dict(), os.path.join(args.out, l.name + '_net.pt'))
+    env.close()
+    print('learning curves: python tools/plot_metrics.py', os.path.join(args.out, '<learner>.jsonl'))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Train DQN variants on one shared replay store.')
+    parser.add_argument('learners', nargs='*', help='any of %s, default: all of them' % ', '.join(SCRIPTS))
+    parser.add_argument('--behaviour', default=None, help='learner whose e-greedy policy acts, or random; '
+                                                          'default: the first learner')
+    parser.add_argument('--num-envs', type=int, default=1, help='CartPole copies stepped together')
+    parser.add_argument('--episodes', type=int, default=1000, help='episodes of the behaviour policy')
+    parser.add_argument('--replay-size', type=int, default=10000)
+    parser.add_argument('--updates-per-step', type=int, default=1, help='updates of every learner per env step')
+    parser.add_argument('--eval-every', type=int, default=100, help='episodes between evaluations')
+    parser.add_argument('--test', type=int, default=10, help='episodes per evaluation')
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--out', default=os.path.join(ROOT, 'compare_learners'), help='directory of the outputs')
+    args = parser.parse_args()
+    args.learners = args.learners or list(SCRIPTS)
+    for name in args.learners:
+        if name not in SCRIPTS:
+            parser.error('unknown learner %s' % name)
+    if args.behaviour not in (None, 'random') + tuple(args.learners):
+        parser.error('--behaviour must be random or one of the learners')
+    run(args)
+
+if __name__ == '__main__':
+    main()
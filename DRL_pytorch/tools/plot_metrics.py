@@ -0,0 +1,99 @@
+"""
+Renders the learning curves of a training run from the metrics file it wrote, outside the training process.
+
+    python tools/plot_metrics.py Nature_DQN/metrics.jsonl
+    python tools/plot_metrics.py DDPG/metrics.jsonl --smooth 20 --show
+    python tools/plot_metrics.py DQN/metrics.jsonl --member 3     # one member of an ensemble run
+
+Top: steps of every episode (its reward for runs that log one, e.g. DDPG) in blue, its average loss in red,
+evaluation rewards as dots.
+Bottom, if the run logged them: epsilon and episodes per second.
+The figure is written next to the metrics file as learning_curve.png unless --out is given.
+"""
+import argparse
+import os
+import sys
+import numpy as np
+sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from common.metrics import columns,read_metrics
+
+
+def smooth(values, window):
+    values = np.array([np.nan if v is None else v for v in values], dtype=np.float64)
+    if window <= 1 or len(values) < window:
+        return values
+    kernel = np.ones(window) / window
+    return np.convolve(values, kernel, mode='valid')
+
+def episodes_per_second(episode):
+    time = np.array(episode['time'])
+    if len(time) < 2:
+        return None, None
+    gaps = np.diff(time)
+    keep = gaps > 0   # a resumed run restarts the clock
+    return np.array(episode['episode'][1:])[keep], 1. / gaps[keep]
+
+def plot(records, smooth_window=1):
+    import matplotlib.pyplot as plt
+    episode = columns(records, 'episode')
+    evaluation = columns(records, 'eval')
+    if not episode:
+        raise ValueError('no episode records in the metrics file')
+    logged = lambda field: any(v is not None for v in episode.get(field, []))
+    curve = 'reward' if logged('reward') else 'steps'
+    x = np.array(episode['episode'])
+    x_smooth = x[len(x) - len(smooth(episode[curve], smooth_window)):]
+
+    fig, axes = plt.subplots(2, 1, sharex=True, figsize=(8, 6), gridspec_kw={'height_ratios': [3, 1]})
+    ax1 = axes[0]
+    ax1.plot(x_smooth, smooth(episode[curve], smooth_window), 'b')
+    ax1.set_ylabel('%s in each episode' % curve)
+    ax1.set_title('learning curves')
+    if evaluation:
+        ax1.plot(evaluation['episode'], evaluation['reward'], 'g.', label='evaluation reward')
+        ax1.legend(loc='upper left')
+    if logged('loss'):
+        ax2 = ax1.twinx()
+        ax2.plot(x_smooth, smooth(episode['loss'], smooth_window), 'r')
+        ax2.set_ylabel('average loss of steps in each episode')
+
+    ax3 = axes[1]
+    rate_x, rate = episodes_per_second(episode)
+    if rate is not None:
+        ax3.plot(rate_x, rate, 'k', linewidth=0.5)
+        ax3.set_ylabel('episodes/s')
+    if logged('epsilon'):
+        ax4 = ax3.twinx()
+        ax4.plot(x, episode['epsilon'], 'm')
+        ax4.set_ylabel('epsilon')
+    ax3.set_xlabel('episode')
+    fig.tight_layout()
+    return fig
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Plot learning curves from a metrics.jsonl file.')
+    parser.add_argument('metrics', help='metrics file written by a training script, e.g. Nature_DQN/metrics.jsonl')
+    parser.add_argument('--out', default=None, help='image to write, default: learning_curve.png next to the metrics')
+    parser.add_argument('--smooth', type=int, default=1, help='moving average window in episodes')
+    parser.add_argument('--dpi', type=int, default=150)
+    parser.add_argument('--member', type=int, default=None, help='only this member of an ensemble run')
+    parser.add_argument('--show', action='store_true', help='also open a window')
+    args = parser.parse_args()
+
+    if not args.show:
+        import matplotlib
+        matplotlib.use('Agg')
+    records = read_metrics(args.metrics)
+    if args.member is not None:
+        records = [r for r in records if r.get('member', args.member) == args.member]
+    fig = plot(records, args.smooth)
+    out = args.out or os.path.join(os.path.dirname(os.path.abspath(args.metrics)), 'learning_curve.png')
+    fig.savefig(out, dpi=args.dpi)
+    print('written to', out)
+    if args.show:
+        import matplotlib.pyplot as plt
+        plt.show()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,152 @@
+"""
+Serves actions of a model saved by one of the training scripts over a local TCP socket.
+
+    python tools/serve.py Nature_DQN/net_model.pkl --port 8765
+    python tools/serve.py DQN.pkl --script DQN/DQN.py
+
+Protocol: one JSON object per line. The client sends {"state": [...]} and gets back {"action": ...},
+or {"error": "..."} if the request was malformed. Requests on one connection are answered in order.
+Requests from all connections are micro-batched: the server gathers up to --max-batch-size states,
+or whatever arrived within --max-wait seconds of the first one, and runs the net once on all of them.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import numpy as np
+import torch as t
+sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from common.inference_server import greedy_actions,sample_actions
+from common.script_loader import load_model
+
+
+def raw_outputs(output):    # e.g. the continuous action of the DDPG actor
+    return output.numpy()
+
+ACTION_FNS = {'greedy': greedy_actions, 'sample': sample_actions, 'raw': raw_outputs}
+
+
+class BatchingServer(object):
+    """
+    asyncio front end of one net. act(state) queues the state with a future; a single batching task
+    collects the queued states, runs the forward pass in a worker thread so the event loop keeps
+    accepting requests meanwhile, and resolves every future with its row of the result.
+    A malformed state fails only its own request: act() checks it against the net's input size before it
+    is queued, and if a batched forward still fails the rows are retried one at a time.
+    """
+
+    def __init__(self, net, action_fn=greedy_actions, max_batch_size=32, max_wait=0.001):
+        self.net = net.eval()
+        self.action_fn = action_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.dtype = next(net.parameters()).dtype
+        self.state_dim = next(p for p in net.parameters() if p.dim() == 2).shape[1]   # in_features of the first layer
+        self.requests = None
+
+    async def act(self, state):
+        state = np.asarray(state, dtype=np.float64)     # ValueError for non-numeric values
+        if state.shape != (self.state_dim,):
+            raise ValueError('state of shape %s, the net takes %d values' % (state.shape, self.state_dim))
+        future = asyncio.get_running_loop().create_future()
+        await self.requests.put((state, future))
+        return await future
+
+    def _forward(self, states):
+        with t.no_grad():
+            output = self.net(t.as_tensor(np.array(states), dtype=self.dtype))
+        return self.action_fn(output)
+
+    async def _collect(self):
+        batch = [await self.requests.get()]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.requests.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _batch_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            states = [state for state, _ in batch]
+            try:
+                actions = await loop.run_in_executor(None, self._forward, states)
+            except Exception:   # one bad row fails the whole forward: retry them one by one so only it fails
+                await self._forward_rows(batch)
+                continue
+            for (_, future), action in zip(batch, actions):
+                if not future.done():
+                    future.set_result(action.tolist())
+
+    async def _forward_rows(self, batch):
+        loop = asyncio.get_running_loop()
+        for state, future in batch:
+            try:
+                action = (await loop.run_in_executor(None, self._forward, [state]))[0]
+            except Exception as e:
+                if not future.done():
+                    future.set_exception(e)
+                continue
+            if not future.done():
+                future.set_result(action.tolist())
+
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    reply = {'action': await self.act(json.loads(line)['state'])}
+                except Exception as e:
+                    reply = {'error': repr(e)}
+                writer.write((json.dumps(reply) + '\n').encode())
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host='127.0.0.1', port=8765):
+        self.requests = asyncio.Queue()
+        batcher = asyncio.ensure_future(self._batch_loop())
+        server = await asyncio.start_server(self._handle, host, port)
+        print('serving on %s:%d' % (host, port))
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            batcher.cancel()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve actions of a saved model over TCP (JSON lines).')
+    parser.add_argument('model', help='model file saved with t.save(net, ...), e.g. Nature_DQN/net_model.pkl')
+    parser.add_argument('--script', default=None, help='training script defining the net class, '
+                                                       'default: the script next to the model')
+    parser.add_argument('--mode', choices=sorted(ACTION_FNS), default='greedy',
+                        help='greedy: argmax of Q values or probabilities, sample: sample a softmax policy, '
+                             'raw: the net output itself')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--max-batch-size', type=int, default=32)
+    parser.add_argument('--max-wait', type=float, default=0.001, help='seconds to wait for a batch to fill')
+    args = parser.parse_args()
+
+    net = load_model(args.model, args.script)
+    server = BatchingServer(net, ACTION_FNS[args.mode], args.max_batch_size, args.max_wait)
+    try:
+        asyncio.run(server.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    main()
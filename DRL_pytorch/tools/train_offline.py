@@ -0,0 +1,123 @@
+"""
+Trains the agent of a training script on a recorded dataset, without stepping the env.
+
+    python tools/train_offline.py Nature_DQN/Nature_DQN.py data/cartpole --done-reward -1
+    python tools/train_offline.py DDPG/DDPG.py data/pendulum --env Pendulum-v0 --reward-scale 0.01 --target-interval 1
+
+Record a dataset by setting RECORD_DIR in a training script (common.dataset.RecordingEnv).
+The agent class of the script (Nature_DQN, DQN or DDPG) is built as the script builds it, then its replay
+buffer or PrefetchSampler is replaced by a DatasetLoader, so train_Q_network / DDPG.learn train on minibatches
+streamed from the dataset's shards. Rewards are recorded as the env returned them: --done-reward and
+--reward-scale redo the shaping the scripts apply before storing a transition.
+Every --eval-every updates the target net (the target actor for DDPG) plays --test episodes in a background
+process. The state_dict of that net is saved as offline_net.pt next to the script unless --out is given.
+"""
+import argparse
+import inspect
+import os
+import sys
+from functools import partial
+import gym
+import numpy as np
+import torch as t
+sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from common.dataset import DatasetLoader
+from common.evaluator import AsyncEvaluator,deterministic_action,greedy_action
+from common.script_loader import load_script
+
+AGENTS = ('Nature_DQN', 'DQN', 'DDPG')   # agent classes trained from a replay buffer, by script
+
+
+def shaping(done_reward=None, reward_scale=1., collate=None):
+    """
+    collate function applying the reward shaping of a training script, then the script's own collate.
+    """
+    def collate_fn(batch):
+        states, actions, rewards, next_states, dones = batch
+        rewards = rewards * reward_scale
+        if done_reward is not None:
+            rewards = t.where(dones > 0, t.full_like(rewards, done_reward), rewards)
+        batch = states, actions, rewards, next_states, dones
+        return collate(batch) if collate is not None else batch
+    return collate_fn
+
+def build_agent(script, name, env):
+    cls = getattr(script, name)
+    agent = cls(env) if inspect.signature(cls).parameters else cls()   # DDPG() knows its env
+    if hasattr(agent, 'memory'):
+        raise ValueError('prioritised replay keeps priorities per stored slot, it cannot stream a dataset')
+    return agent
+
+def attach(agent, loader):
+    if hasattr(agent, 'sampler'):   # DQN, DDPG sample through a PrefetchSampler
+        agent.sampler.close()
+        agent.sampler = loader
+    else:
+        agent.replay_buffer = loader
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Train an agent on a recorded transition dataset.')
+    parser.add_argument('script', help='training script defining the agent, e.g. Nature_DQN/Nature_DQN.py')
+    parser.add_argument('dataset', help='directory recorded with RECORD_DIR')
+    parser.add_argument('--agent', default=None, help='agent class, default: the first of %s in the script' % ', '.join(AGENTS))
+    parser.add_argument('--env', default=None, help='env to evaluate on, default: ENV_NAME of the script')
+    parser.add_argument('--updates', type=int, default=20000)
+    parser.add_argument('--target-interval', type=int, default=100, help='updates between target net syncs')
+    parser.add_argument('--done-reward', type=float, default=None, help='reward of transitions that end an episode')
+    parser.add_argument('--reward-scale', type=float, default=1.)
+    parser.add_argument('--read-ahead', type=int, default=8, help='minibatches the loader keeps ready')
+    parser.add_argument('--mix', type=int, default=2, help='shards shuffled together')
+    parser.add_argument('--eval-every', type=int, default=1000, help='updates between evaluations')
+    parser.add_argument('--test', type=int, default=10, help='episodes per evaluation')
+    parser.add_argument('--log-every', type=int, default=100, help='updates between loss prints')
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--out', default=None, help='file to save the trained net to')
+    args = parser.parse_args()
+
+    script = load_script(os.path.abspath(args.script))
+    name = args.agent or next((a for a in AGENTS if hasattr(script, a)), None)
+    env_name = args.env or getattr(script, 'ENV_NAME', None)
+    if name is None:
+        parser.error('no agent class in %s, pass --agent' % args.script)
+    if env_name is None:
+        parser.error('%s has no ENV_NAME, pass --env' % args.script)
+    env = gym.make(env_name)
+    agent = build_agent(script, name, env)
+    dtype = np.float64 if t.get_default_dtype() == t.float64 else np.float32   # DDPG trains in double
+    loader = DatasetLoader(args.dataset, script.BATCH_SIZE, args.read_ahead, args.mix, dtype,
+                           shaping(args.done_reward, args.reward_scale, getattr(script, 'collate_batch', None)), args.seed)
+    attach(agent, loader)
+    learn = getattr(agent, 'learn_step', None) or agent.learn
+    net = getattr(agent, 'target_net', None) or getattr(agent, 'target_actor', None) or agent.q_net
+    action_fn = deterministic_action if hasattr(agent, 'target_actor') else greedy_action
+    evaluator = AsyncEvaluator(partial(gym.make, env_name), net, action_fn, args.test)
+    print(len(loader), 'transitions in', args.dataset)
+
+    def report(results):
+        for updates, ave_reward in results:
+            print('updates: ', updates, 'Evaluation Average Reward:', ave_reward)
+
+    loss = 0.
+    for update in range(1, args.updates + 1):
+        loss += learn()
+        if update % args.target_interval == 0 and hasattr(agent, 'update_target_net'):
+            agent.update_target_net()
+        if update % args.log_every == 0:
+            print('updates:', update, '  loss:', loss / args.log_every)
+            loss = 0.
+        if update % args.eval_every == 0:
+            evaluator.submit(update, net)
+        report(evaluator.poll())
+    report(evaluator.close())
+
+    if hasattr(agent, 'close'):
+        agent.close()
+    loader.close()
+    env.close()
+    out = args.out or os.path.join(os.path.dirname(os.path.abspath(args.script)), 'offline_net.pt')
+    t.save(net.state_dict(), out)
+    print('saved to', out)
+
+if __name__ == '__main__':
+    main()
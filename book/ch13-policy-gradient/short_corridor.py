@@ -6,11 +6,15 @@
 # declaration at the top                                              #
 #######################################################################
 
+import os
+import sys
 import numpy as np
 import matplotlib
 matplotlib.use('Agg')
 import matplotlib.pyplot as plt
 from tqdm import tqdm
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.realpath(__file__)))), 'DRL_pytorch'))
+from common.returns import discounted_returns
 
 def true_value(p):
     """ True value of the first state
@@ -109,11 +113,7 @@ class ReinforceAgent:
         self.rewards.append(last_reward)    #最后一次reward是0
 
         # learn theta
-        G = np.zeros(len(self.rewards)) #每次reward都是-1，列表的总长度的相反数就是return
-        G[-1] = self.rewards[-1]    #前面加负号表示从后往前数
-
-        for i in range(2, len(G) + 1):  #从后往前算
-            G[-i] = self.gamma * G[-i + 1] + self.rewards[-i]
+        G = discounted_returns(np.array(self.rewards)[None], self.gamma)[0] #每次reward都是-1，从后往前累加得到每一步的return
 
         gamma_pow = 1   #gama的t次方，这里一直是1
 
@@ -139,11 +139,7 @@ class ReinforceBaselineAgent(ReinforceAgent):
         self.rewards.append(last_reward)
 
         # learn theta and w
-        G = np.zeros(len(self.rewards))
-        G[-1] = self.rewards[-1]
-
-        for i in range(2, len(G) + 1):
-            G[-i] = self.gamma * G[-i + 1] + self.rewards[-i]
+        G = discounted_returns(np.array(self.rewards)[None], self.gamma)[0]
 
         gamma_pow = 1
 